@@ -4,15 +4,9 @@ import sys
 
 from flask import Flask
 import requests
-import requests_cache
 import sentry_sdk
 from sentry_sdk.integrations.flask import FlaskIntegration
 
-requests_cache.install_cache(
-    "my_requests_cache", expire_after=60 * 60 * 24 * 1
-)  # expire_after is in seconds
-requests_cache.clear()
-
 # set up logging
 # see http://wiki.pylonshq.com/display/pylonscookbook/Alternative+logging+configuration
 logging.basicConfig(
@@ -0,0 +1,96 @@
+"""
+Resolves a list of inputs at once for POST /products. Inputs that are the same
+project entered different ways are resolved once, and results come back as soon
+as each one is ready rather than in input order.
+"""
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import os
+import threading
+
+import bulk_doi
+from canonical import canonical_id
+import product_cache
+from software import unsupported_input_message
+from steps import arxiv_lookup
+from steps.deadline import Deadline
+
+# resolutions run at the same time for batch requests, shared by every request in a process
+BATCH_THREADS = int(os.environ.get("CITEAS_BATCH_THREADS", 8))
+# most inputs a background job takes
+MAX_BATCH_SIZE = int(os.environ.get("CITEAS_MAX_BATCH_SIZE", 10000))
+# most inputs POST /products streams, small enough to finish inside the
+# gunicorn worker timeout. Bigger batches go to /jobs or bulk.py.
+MAX_STREAM_SIZE = int(os.environ.get("CITEAS_MAX_STREAM_SIZE", 50))
+# most time spent looking DOIs and arXiv ids up in bulk before the first result,
+# the steps look up whatever's left themselves
+PREFETCH_TIMEOUT_MS = int(os.environ.get("CITEAS_PREFETCH_TIMEOUT_MS", 5000))
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def get_batch_executor():
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(
+                max_workers=BATCH_THREADS, thread_name_prefix="citeas-batch"
+            )
+            _executor_pid = os.getpid()
+    return _executor
+
+
+def resolve_one(user_supplied_id, timeout_ms=None):
+    error_message = unsupported_input_message(user_supplied_id)
+    if error_message:
+        return {"error_message": error_message}
+    try:
+        return {"result": product_cache.resolve(user_supplied_id, timeout_ms)}
+    except Exception as e:
+        # one bad input shouldn't take the rest of the batch down with it
+        print("batch resolution failed for {}: {}".format(user_supplied_id, e))
+        return {"error_message": "couldn't resolve this input"}
+
+
+def resolve_batch(ids, timeout_ms=None):
+    """
+    Yields one dict per input, in completion order, each tagged with the
+    input's index in ids.
+    """
+    # canonical id -> indexes of the inputs that share it
+    groups = OrderedDict()
+    for index, user_supplied_id in enumerate(ids):
+        groups.setdefault(canonical_id(user_supplied_id), []).append(index)
+
+    unique_ids = [ids[indexes[0]] for indexes in groups.values()]
+    deadline = Deadline.from_ms(
+        min(timeout_ms or PREFETCH_TIMEOUT_MS, PREFETCH_TIMEOUT_MS)
+    )
+    bulk_doi.prefetch(unique_ids, deadline)
+    arxiv_lookup.prefetch(unique_ids, deadline)
+
+    executor = get_batch_executor()
+    futures = {
+        executor.submit(resolve_one, ids[indexes[0]], timeout_ms): indexes
+        for indexes in groups.values()
+    }
+    try:
+        for future in as_completed(futures):
+            response = future.result()
+            indexes = futures[future]
+            for index in indexes:
+                if "result" in response:
+                    # same key, but each input gets its own url and first step
+                    response = dict(
+                        response,
+                        result=product_cache.for_input(
+                            response["result"], ids[indexes[0]], ids[index]
+                        ),
+                    )
+                yield dict(response, index=index, id=ids[index])
+    finally:
+        # a client that hangs up doesn't need the rest
+        for future in futures:
+            future.cancel()
@@ -0,0 +1,133 @@
+"""
+Resolves many inputs outside the web app, one input per line, across a pool of
+processes sharing the on-disk http cache. Results are written as JSON lines as
+they complete, and a checkpoint file lets a killed run pick up where it stopped.
+Failed inputs and results cut short by the deadline aren't checkpointed, so the
+next run tries them again and writes a later line for the same index.
+
+    python bulk.py inputs.txt -o results.jsonl
+    cat inputs.txt | python bulk.py - > results.jsonl --checkpoint run.checkpoint
+"""
+import argparse
+import functools
+import json
+from multiprocessing import Pool
+import os
+import sys
+
+from batch import resolve_one
+import bulk_doi
+from product_cache import is_complete
+from software import unsupported_input_message
+from steps import arxiv_lookup
+
+# inputs read ahead at a time, so their DOIs and arXiv ids can be fetched in bulk
+PREFETCH_CHUNK = 1000
+
+
+def resolve_item(item, timeout_ms=None):
+    index, user_supplied_id = item
+    return dict(
+        resolve_one(user_supplied_id, timeout_ms), index=index, id=user_supplied_id
+    )
+
+
+def resolve_many(ids, processes=None, timeout_ms=None, skip=None):
+    """
+    Resolves every input of an iterable across a process pool, yielding one dict
+    per input in completion order, tagged with the input's index.
+    Indexes in skip, e.g. from a checkpoint, aren't resolved again, nor are blank inputs.
+    """
+    skip = skip or set()
+    items = ((index, id) for index, id in enumerate(ids) if id and index not in skip)
+    with Pool(processes) as pool:
+        items = with_prefetch(items)
+        for response in pool.imap_unordered(
+            functools.partial(resolve_item, timeout_ms=timeout_ms), items
+        ):
+            yield response
+
+
+def with_prefetch(items):
+    # the on-disk http cache is shared, so what's fetched here are cache hits in the pool
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == PREFETCH_CHUNK:
+            prefetch_chunk(chunk)
+            yield from chunk
+            chunk = []
+    prefetch_chunk(chunk)
+    yield from chunk
+
+
+def prefetch_chunk(chunk):
+    ids = [id for index, id in chunk]
+    bulk_doi.prefetch(ids)
+    arxiv_lookup.prefetch(ids)
+
+
+def is_final(response):
+    """
+    Whether a response is worth checkpointing: a complete result, or an input
+    that will never be supported.
+    """
+    if "result" in response:
+        return is_complete(response["result"])
+    return unsupported_input_message(response["id"]) is not None
+
+
+def read_ids(f):
+    # blank lines keep their index so line numbers stay stable between runs
+    for line in f:
+        yield line.strip()
+
+
+def read_checkpoint(path):
+    if not path or not os.path.exists(path):
+        return set()
+    with open(path) as f:
+        return {int(line) for line in f if line.strip()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Resolve many inputs to citations.")
+    parser.add_argument("input", help="file with one input per line, - for stdin")
+    parser.add_argument("-o", "--output", help="JSON lines output, default stdout")
+    parser.add_argument(
+        "--checkpoint",
+        help="file of finished line numbers, default <output>.checkpoint",
+    )
+    parser.add_argument("--processes", type=int, default=os.cpu_count())
+    parser.add_argument("--timeout-ms", type=int)
+    args = parser.parse_args(argv)
+
+    checkpoint_path = args.checkpoint
+    if not checkpoint_path and args.output:
+        checkpoint_path = args.output + ".checkpoint"
+    done = read_checkpoint(checkpoint_path)
+    if done:
+        print("resuming, {} inputs already done".format(len(done)), file=sys.stderr)
+
+    in_file = sys.stdin if args.input == "-" else open(args.input)
+    out_file = open(args.output, "a") if args.output else sys.stdout
+    checkpoint_file = open(checkpoint_path, "a") if checkpoint_path else None
+    try:
+        responses = resolve_many(
+            read_ids(in_file), args.processes, args.timeout_ms, skip=done
+        )
+        for response in responses:
+            out_file.write(json.dumps(response, sort_keys=True, default=str) + "\n")
+            out_file.flush()
+            # only after the result is written, so a kill can repeat a line but never lose one
+            if checkpoint_file and is_final(response):
+                checkpoint_file.write("{}\n".format(response["index"]))
+                checkpoint_file.flush()
+    finally:
+        for f in (in_file, out_file, checkpoint_file):
+            if f not in (None, sys.stdin, sys.stdout):
+                f.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+CSL-JSON for many DOIs in as few requests as possible, for batches and backfills.
+
+DOIs are grouped by registration agency (doi.org/ra), then Crossref DOIs are
+looked up 50 at a time through the works filter and DataCite DOIs through the
+dois ids query. Whatever is left is looked up one by one, concurrently, the same
+way CrossrefResponseStep does it. Records from the bulk answers are put in the
+http cache under the DOI's own url, so the step finds them there later. DOIs in
+the local doi_store aren't looked up at all.
+
+Batches only prefetch, within a deadline and without the one by one lookups,
+which the steps make themselves.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import urllib.parse
+
+import requests
+
+from canonical import doi_re
+import doi_store
+from doi_store import crossref_work_to_csl, datacite_record_to_csl
+from steps import http_cache
+from steps.fetch import http_get
+
+DOI_URL = os.environ.get("CITEAS_DOI_URL", "https://doi.org/")
+RA_URL = os.environ.get("CITEAS_DOI_RA_URL", "https://doi.org/ra/")
+CROSSREF_API_URL = os.environ.get("CITEAS_CROSSREF_API_URL", "https://api.crossref.org")
+DATACITE_API_URL = os.environ.get("CITEAS_DATACITE_API_URL", "https://api.datacite.org")
+# gets us into Crossref's polite pool
+CROSSREF_MAILTO = os.environ.get("CITEAS_CROSSREF_MAILTO")
+
+THREADS = int(os.environ.get("CITEAS_BULK_DOI_THREADS", 8))
+# records rebuilt from bulk answers are thinner than doi.org's own CSL, so they're
+# only kept long enough for the batch that fetched them
+SEED_TTL = int(os.environ.get("CITEAS_BULK_DOI_SEED_TTL", 60 * 60))
+CHUNK_SIZE = 50
+
+CSL_TYPE = "application/vnd.citationstyles.csl+json"
+CSL_HEADERS = {"Accept": CSL_TYPE}
+
+
+def doi_from_input(user_supplied_id):
+    match = doi_re.match(user_supplied_id.strip())
+    return match.group(1) if match else None
+
+
+def chunks(items, size=CHUNK_SIZE):
+    return [items[i : i + size] for i in range(0, len(items), size)]
+
+
+def registration_agencies(dois, deadline=None):
+    """
+    {lowercased doi: agency name}, for the DOIs doi.org knows about.
+    """
+    agencies = {}
+    for records in map_chunks(get_agency_chunk, dois, deadline):
+        for record in records:
+            if "RA" in record:
+                agencies[record["DOI"].lower()] = record["RA"]
+    return agencies
+
+
+def quote_dois(dois, prefix=""):
+    # DOIs can hold nearly any character, keep them from breaking the query
+    return ",".join(prefix + urllib.parse.quote(doi, safe="/") for doi in dois)
+
+
+def get_agency_chunk(dois, deadline=None):
+    r = http_get(RA_URL + quote_dois(dois), use_cache=False, deadline=deadline)
+    return r.json() if r.status_code == 200 else []
+
+
+def get_crossref_chunk(dois, deadline=None):
+    url = "{}/works?filter={}&rows={}".format(
+        CROSSREF_API_URL, quote_dois(dois, prefix="doi:"), len(dois)
+    )
+    if CROSSREF_MAILTO:
+        url += "&mailto=" + CROSSREF_MAILTO
+    r = http_get(url, use_cache=False, deadline=deadline)
+    if r.status_code != 200:
+        return []
+    return [crossref_work_to_csl(work) for work in r.json()["message"]["items"]]
+
+
+def get_datacite_chunk(dois, deadline=None):
+    url = "{}/dois?ids={}&page[size]={}".format(
+        DATACITE_API_URL, quote_dois(dois), len(dois)
+    )
+    r = http_get(url, use_cache=False, deadline=deadline)
+    if r.status_code != 200:
+        return []
+    return [datacite_record_to_csl(record) for record in r.json()["data"]]
+
+
+def get_single(doi):
+    # the same request CrossrefResponseStep makes, so it lands in the same cache entry
+    r = http_get(DOI_URL + doi, headers=CSL_HEADERS)
+    if r.status_code != 200:
+        return None
+    return r.json()
+
+
+def map_chunks(fn, dois, deadline=None):
+    """
+    fn applied to CHUNK_SIZE slices of dois, concurrently. A failed chunk gives [].
+    """
+
+    def safe(chunk):
+        try:
+            return fn(chunk, deadline=deadline)
+        except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+            print("bulk doi request failed: {}".format(e))
+            return []
+
+    with ThreadPoolExecutor(max_workers=THREADS) as executor:
+        return list(executor.map(safe, chunks(dois)))
+
+
+def get_single_or_none(doi):
+    try:
+        return get_single(doi)
+    except (requests.exceptions.RequestException, ValueError) as e:
+        print("doi lookup failed for {}: {}".format(doi, e))
+        return None
+
+
+def resolve_dois(dois, deadline=None, look_up_missing=True):
+    """
+    Returns {doi: csl dict or None} for every doi given. Without look_up_missing,
+    only what the bulk endpoints return.
+    """
+    dois = list(dict.fromkeys(dois))
+    agencies = registration_agencies(dois, deadline)
+
+    found = {}
+    for agency, get_chunk in (
+        ("Crossref", get_crossref_chunk),
+        ("DataCite", get_datacite_chunk),
+    ):
+        agency_dois = [doi for doi in dois if agencies.get(doi.lower()) == agency]
+        for records in map_chunks(get_chunk, agency_dois, deadline):
+            for csl in records:
+                found[csl["DOI"].lower()] = csl
+
+    results = {}
+    for doi in dois:
+        results[doi] = found.get(doi.lower())
+        if results[doi] is not None:
+            body = json.dumps(results[doi]).encode("utf-8")
+            http_cache.seed(DOI_URL + doi, CSL_HEADERS, body, CSL_TYPE, ttl=SEED_TTL)
+
+    if not look_up_missing:
+        return results
+    # other agencies, and anything the bulk endpoints didn't return
+    missing = [doi for doi in dois if results[doi] is None]
+    with ThreadPoolExecutor(max_workers=THREADS) as executor:
+        for doi, csl in zip(missing, executor.map(get_single_or_none, missing)):
+            results[doi] = csl
+    return results
+
+
+def prefetch(user_supplied_ids, deadline=None):
+    """
+    Warms the http cache for the DOIs among these inputs, before they're resolved
+    one by one, giving up at the deadline.
+    """
+    dois = [doi for doi in map(doi_from_input, user_supplied_ids) if doi]
+    # the step finds these in the local store without going to doi.org
+    dois = [doi for doi in dois if doi_store.get(doi) is None]
+    if len(dois) < 2:
+        # the agency lookup would cost more than it saves
+        return
+    try:
+        resolve_dois(dois, deadline, look_up_missing=False)
+    except Exception as e:
+        # only ever a head start, the steps will look the DOIs up themselves
+        print("bulk doi prefetch failed: {}".format(e))
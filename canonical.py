@@ -0,0 +1,107 @@
+"""
+Stable keys for user input, so the same project entered different ways shares
+cache entries and in-flight work. Purely string work, nothing is fetched.
+
+    10.5281/ZENODO.160400, https://doi.org/10.5281/zenodo.160400  -> doi:10.5281/zenodo.160400
+    arXiv:1802.02689, https://arxiv.org/abs/1802.02689           -> arxiv:1802.02689
+    https://github.com/tidyverse/ggplot2/blob/master/README.md   -> gh:tidyverse/ggplot2
+    https://cran.r-project.org/web/packages/stringr/vignettes/..  -> cran:stringr
+    https://pypi.python.org/pypi/Python_Executor                  -> pypi:python-executor
+    https://pubmed.ncbi.nlm.nih.gov/30371852/                     -> pmid:30371852
+    https://www.example.org/project/                              -> url:example.org/project
+    Some Keywords                                                 -> kw:some keywords
+"""
+import re
+import urllib.parse
+
+import validators
+
+doi_re = re.compile(
+    r"^(?:doi:\s*|(?:https?://)?(?:dx\.)?doi\.org/)?(10\.\d{4,9}/\S+)$", re.I
+)
+arxiv_re = re.compile(
+    r"^(?:arxiv:\s*|(?:https?://)?(?:www\.)?arxiv\.org/(?:abs|pdf)/)?"
+    r"(\d{4}\.\d{4,5}(?:v\d+)?)(?:\.pdf)?$",
+    re.I,
+)
+github_re = re.compile(
+    r"^(?:https?://)?(?:www\.)?github\.com/([^/?#]+)(?:/([^/?#]+))?", re.I
+)
+cran_re = re.compile(
+    r"^(?:https?://)?(?:www\.)?cran\.r-project\.org/"
+    r"(?:web/packages/|package=)([A-Za-z0-9.]+)",
+    re.I,
+)
+pypi_re = re.compile(
+    r"^(?:https?://)?(?:www\.)?pypi\.(?:org/project|python\.org/pypi)/([^/?#]+)", re.I
+)
+pmid_re = re.compile(
+    r"^(?:https?://)?(?:www\.)?(?:pubmed\.ncbi\.nlm\.nih\.gov/|ncbi\.nlm\.nih\.gov/pubmed/)(\d+)",
+    re.I,
+)
+pmcid_re = re.compile(
+    r"^(?:(?:https?://)?(?:www\.)?ncbi\.nlm\.nih\.gov/pmc/articles/)?(PMC\d+)/?$", re.I
+)
+
+
+def canonical_id(user_supplied_id):
+    """
+    The stable key for this input, prefixed with its kind.
+    """
+    input = user_supplied_id.strip()
+
+    match = doi_re.match(input)
+    if match:
+        # DOIs are case insensitive
+        return "doi:" + match.group(1).rstrip(".,;").lower()
+
+    match = arxiv_re.match(input)
+    if match:
+        return "arxiv:" + match.group(1).lower()
+
+    match = github_re.match(input)
+    if match:
+        owner, repo = match.groups()
+        if not repo:
+            return "gh:" + owner.lower()
+        if repo.lower().endswith(".git"):
+            repo = repo[:-4]
+        return "gh:{}/{}".format(owner, repo).lower()
+
+    match = cran_re.match(input)
+    if match:
+        # R package names are case sensitive
+        return "cran:" + match.group(1)
+
+    match = pypi_re.match(input)
+    if match:
+        # PEP 503 name normalization
+        return "pypi:" + re.sub(r"[-_.]+", "-", match.group(1)).lower()
+
+    match = pmid_re.match(input)
+    if match:
+        return "pmid:" + match.group(1)
+
+    match = pmcid_re.match(input)
+    if match:
+        return "pmcid:" + match.group(1).upper()
+
+    if input.startswith(("http://", "https://")) or validators.url("http://" + input):
+        return "url:" + normalize_url(input)
+
+    return "kw:" + " ".join(input.lower().split())
+
+
+def normalize_url(url):
+    if not url.startswith(("http://", "https://")):
+        url = "http://" + url
+    parts = urllib.parse.urlsplit(url)
+    host = (parts.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    if parts.port and parts.port not in (80, 443):
+        host = "{}:{}".format(host, parts.port)
+    path = parts.path.rstrip("/")
+    if parts.query:
+        path += "?" + parts.query
+    return host + path
@@ -0,0 +1,285 @@
+"""
+Local index of CRAN packages' DESCRIPTION files, so the CRAN steps can resolve
+a package's title, authors, version, publication date and CITATION without
+fetching its pages. Packages missing from the index are fetched live as before.
+
+The index is a SQLite file (CITEAS_CRAN_INDEX_PATH), skipped when it doesn't
+exist. Load it from a mirror: DCF bundles of DESCRIPTION records separated by
+blank lines, or directories of unpacked packages. `refresh` brings it up to
+date with CRAN, fetching only the packages whose version changed. DCF bundles
+don't say whether a package has a CITATION, so for packages only known from
+one the citation page is still fetched live.
+
+    python cran_index.py import descriptions.dcf mirror/src/contrib/unpacked/
+    python cran_index.py refresh
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import gzip
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+
+import requests
+
+from steps.fetch import DEFAULT_TIMEOUT, get_session, http_get
+
+INDEX_PATH = os.environ.get("CITEAS_CRAN_INDEX_PATH", "citeas_cran.sqlite")
+CRAN_URL = os.environ.get("CITEAS_CRAN_URL", "https://cran.r-project.org")
+THREADS = int(os.environ.get("CITEAS_CRAN_REFRESH_THREADS", 8))
+
+_local = threading.local()
+
+
+def get_db(create=False):
+    pid = os.getpid()
+    if getattr(_local, "pid", None) != pid:
+        if not create and not os.path.exists(INDEX_PATH):
+            return None
+        db = sqlite3.connect(INDEX_PATH, timeout=30)
+        db.execute("PRAGMA journal_mode=WAL")
+        # has_citation is NULL when the source didn't say. citation is the
+        # CITATION file or CRAN's citation page, when we have it
+        db.execute(
+            """CREATE TABLE IF NOT EXISTS packages (
+                name TEXT PRIMARY KEY,
+                version TEXT,
+                description TEXT,
+                has_citation INTEGER,
+                citation TEXT
+            ) WITHOUT ROWID"""
+        )
+        columns = [row[1] for row in db.execute("PRAGMA table_info(packages)")]
+        if "citation" not in columns:
+            db.execute("ALTER TABLE packages ADD COLUMN citation TEXT")
+        db.commit()
+        _local.db = db
+        _local.pid = pid
+    return _local.db
+
+
+def field(record, name):
+    match = re.search(r"^{}:\s*(.*)$".format(re.escape(name)), record, re.M)
+    return match.group(1).strip() if match else None
+
+
+def split_dcf(text):
+    """
+    The records of a DCF file, e.g. concatenated DESCRIPTION files.
+    """
+    return [record.strip() for record in re.split(r"\n\s*\n", text) if record.strip()]
+
+
+def get(package_name):
+    """
+    {"version", "description", "has_citation", "citation"} for an indexed
+    package, or None.
+    """
+    db = get_db()
+    if db is None or not package_name:
+        return None
+    try:
+        row = db.execute(
+            "SELECT version, description, has_citation, citation FROM packages "
+            "WHERE name = ?",
+            (package_name.lower(),),
+        ).fetchone()
+    except sqlite3.Error as e:
+        print("cran index lookup failed for {}: {}".format(package_name, e))
+        return None
+    if row is None:
+        return None
+    version, description, has_citation, citation = row
+    return {
+        "version": version,
+        "description": description,
+        "has_citation": None if has_citation is None else bool(has_citation),
+        "citation": citation,
+    }
+
+
+def put_many(entries):
+    """
+    Stores (description, has_citation, citation) entries, skipping packages
+    already indexed at the same version. Returns how many were stored.
+    """
+    db = get_db(create=True)
+    indexed = dict(db.execute("SELECT name, version FROM packages"))
+    rows = []
+    for description, has_citation, citation in entries:
+        name = field(description, "Package")
+        if not name:
+            continue
+        version = field(description, "Version")
+        if indexed.get(name.lower()) == version and has_citation is None:
+            continue
+        rows.append((name.lower(), version, description, has_citation, citation))
+    with db:
+        db.executemany(
+            "INSERT OR REPLACE INTO packages "
+            "(name, version, description, has_citation, citation) "
+            "VALUES (?, ?, ?, ?, ?)",
+            rows,
+        )
+    return len(rows)
+
+
+def read_path(path):
+    """
+    Yields (description, has_citation, citation) from a DCF bundle, or from
+    each package found under a directory of unpacked packages.
+    """
+    if not os.path.isdir(path):
+        with open(path, encoding="utf-8", errors="replace") as f:
+            for record in split_dcf(f.read()):
+                yield record, None, None
+        return
+    for dirpath, dirnames, filenames in os.walk(path):
+        if "DESCRIPTION" not in filenames:
+            continue
+        with open(
+            os.path.join(dirpath, "DESCRIPTION"), encoding="utf-8", errors="replace"
+        ) as f:
+            description = f.read().strip()
+        citation = None
+        # source packages keep it in inst/, installed ones at the top
+        for parts in (("inst", "CITATION"), ("CITATION",)):
+            citation_path = os.path.join(dirpath, *parts)
+            if os.path.exists(citation_path):
+                with open(citation_path, encoding="utf-8", errors="replace") as f:
+                    citation = f.read()
+                break
+        yield description, citation is not None, citation
+        # nothing else of interest inside a package
+        dirnames[:] = []
+
+
+def import_paths(paths):
+    total = 0
+    for path in paths:
+        count = put_many(read_path(path))
+        print("indexed {} packages from {}".format(count, path), file=sys.stderr)
+        total += count
+    return total
+
+
+def get_description(name):
+    r = http_get(
+        "{}/web/packages/{}/DESCRIPTION".format(CRAN_URL, name), use_cache=False
+    )
+    return r.text.strip() if r.status_code == 200 else None
+
+
+def get_citation(name):
+    """
+    (has_citation, citation page) from CRAN, with has_citation None when it
+    couldn't tell.
+    """
+    r = http_get(
+        "{}/web/packages/{}/citation.html".format(CRAN_URL, name), use_cache=False
+    )
+    if r.status_code == 404:
+        return False, None
+    if r.status_code == 200 and not r.truncated:
+        return True, r.text
+    return None, None
+
+
+def get_listing():
+    """
+    CRAN's PACKAGES list, read whole: it is far over http_get's caps, and a cut
+    short list would look like packages were removed.
+    """
+    r = get_session().get(
+        CRAN_URL + "/src/contrib/PACKAGES.gz", timeout=DEFAULT_TIMEOUT
+    )
+    r.raise_for_status()
+    body = r.content
+    # unless the server sent it with a gzip Content-Encoding, requests leaves it packed
+    if body[:2] == b"\x1f\x8b":
+        body = gzip.decompress(body)
+    current = {}
+    for record in split_dcf(body.decode("utf-8", "replace")):
+        if field(record, "Package"):
+            current[field(record, "Package")] = field(record, "Version")
+    return current
+
+
+def refresh():
+    """
+    Indexes packages that are new or have a new version on CRAN, and drops ones
+    CRAN no longer lists. Returns (stored, dropped).
+    """
+    current = get_listing()
+    if not current:
+        raise ValueError("CRAN's package list came back empty")
+
+    db = get_db(create=True)
+    indexed = dict(db.execute("SELECT name, version FROM packages"))
+    changed = [
+        name
+        for name, version in current.items()
+        if indexed.get(name.lower()) != version
+    ]
+
+    def safe_get_package(name):
+        try:
+            description = get_description(name)
+            if description is None:
+                return None
+            return (description,) + get_citation(name)
+        except requests.exceptions.RequestException as e:
+            print("couldn't fetch {} from CRAN: {}".format(name, e))
+            return None
+
+    with ThreadPoolExecutor(max_workers=THREADS) as executor:
+        entries = [e for e in executor.map(safe_get_package, changed) if e is not None]
+    stored = put_many(entries)
+
+    gone = set(indexed) - {name.lower() for name in current}
+    # CRAN only ever archives a few packages at a time, a list missing half the
+    # index is more likely broken
+    if len(gone) > len(indexed) // 2:
+        print(
+            "not dropping {} of {} packages missing from CRAN's list".format(
+                len(gone), len(indexed)
+            ),
+            file=sys.stderr,
+        )
+        gone = set()
+    with db:
+        db.executemany("DELETE FROM packages WHERE name = ?", [(n,) for n in gone])
+    return stored, len(gone)
+
+
+def index_stats():
+    db = get_db()
+    if db is None:
+        return {"packages": 0}
+    return {"packages": db.execute("SELECT COUNT(*) FROM packages").fetchone()[0]}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage the local CRAN index.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    import_parser = commands.add_parser(
+        "import", help="index DCF bundles or directories of unpacked packages"
+    )
+    import_parser.add_argument("paths", nargs="+")
+    commands.add_parser("refresh", help="index what changed on CRAN")
+    commands.add_parser("stats", help="count indexed packages")
+    args = parser.parse_args(argv)
+
+    if args.command == "import":
+        import_paths(args.paths)
+    elif args.command == "refresh":
+        stored, dropped = refresh()
+        print("indexed {}, dropped {}".format(stored, dropped), file=sys.stderr)
+    print(json.dumps(index_stats()))
+
+
+if __name__ == "__main__":
+    main()
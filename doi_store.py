@@ -0,0 +1,269 @@
+"""
+Local store of DOI metadata, loaded from Crossref and DataCite dumps and
+consulted by CrossrefResponseStep before doi.org.
+
+Records are CSL-JSON, zlib-compressed, keyed by lowercased DOI in a SQLite file
+(CITEAS_DOI_STORE_PATH). Lookups are skipped when the file doesn't exist.
+Imports are incremental: files already imported unchanged are skipped, and a
+DOI imported again replaces its earlier record.
+
+    python doi_store.py import crossref-2024/*.json.gz datacite.jsonl
+    python doi_store.py stats
+"""
+import argparse
+import gzip
+import json
+import os
+import sqlite3
+import sys
+import threading
+import zlib
+
+STORE_PATH = os.environ.get("CITEAS_DOI_STORE_PATH", "citeas_dois.sqlite")
+# records per transaction during imports
+IMPORT_BATCH = 10000
+
+# Crossref work types that aren't named the same in CSL
+CROSSREF_TYPES = {
+    "journal-article": "article-journal",
+    "proceedings-article": "paper-conference",
+    "book-chapter": "chapter",
+    "book-section": "chapter",
+    "book-part": "chapter",
+    "edited-book": "book",
+    "reference-book": "book",
+    "monograph": "book",
+    "book": "book",
+    "dissertation": "thesis",
+    "posted-content": "article",
+    "reference-entry": "entry",
+    "peer-review": "review",
+    "report": "report",
+    "dataset": "dataset",
+}
+
+_local = threading.local()
+
+
+def crossref_work_to_csl(work):
+    csl = {
+        key: work[key]
+        for key in (
+            "DOI",
+            "URL",
+            "author",
+            "editor",
+            "issued",
+            "published-print",
+            "published-online",
+            "volume",
+            "issue",
+            "page",
+            "publisher",
+            "ISSN",
+            "ISBN",
+            "language",
+        )
+        if key in work
+    }
+    csl["type"] = CROSSREF_TYPES.get(work.get("type"), "article")
+    # lists in the works api, single strings in csl
+    for key in ("title", "container-title"):
+        if work.get(key):
+            csl[key] = work[key][0]
+    if work.get("short-container-title"):
+        csl["container-title-short"] = work["short-container-title"][0]
+    return csl
+
+
+def datacite_record_to_csl(record):
+    attributes = record["attributes"]
+    authors = []
+    for creator in attributes.get("creators") or []:
+        if creator.get("familyName"):
+            authors.append(
+                {"family": creator["familyName"], "given": creator.get("givenName", "")}
+            )
+        else:
+            authors.append({"literal": creator.get("name", "")})
+    publisher = attributes.get("publisher")
+    if isinstance(publisher, dict):
+        publisher = publisher.get("name")
+
+    csl = {
+        "type": (attributes.get("types") or {}).get("citeproc") or "article",
+        "DOI": attributes["doi"],
+        "URL": attributes.get("url"),
+        "author": authors,
+        "publisher": publisher,
+    }
+    if attributes.get("titles"):
+        csl["title"] = attributes["titles"][0]["title"]
+    if attributes.get("publicationYear"):
+        csl["issued"] = {"date-parts": [[int(attributes["publicationYear"])]]}
+    if attributes.get("version"):
+        csl["version"] = attributes["version"]
+    return csl
+
+
+def record_to_csl(record):
+    """
+    CSL-JSON for a DataCite record, a Crossref work, or a record that's CSL already.
+    """
+    if "attributes" in record:
+        return datacite_record_to_csl(record)
+    if isinstance(record.get("title"), list) or is_crossref_work(record):
+        return crossref_work_to_csl(record)
+    return record
+
+
+def is_crossref_work(record):
+    # works without a title still carry crossref's own bookkeeping, csl never does
+    return "DOI" in record and ("member" in record or "deposited" in record)
+
+
+def get_db(create=False):
+    pid = os.getpid()
+    if getattr(_local, "pid", None) != pid:
+        if not create and not os.path.exists(STORE_PATH):
+            return None
+        db = sqlite3.connect(STORE_PATH, timeout=30)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS dois (doi TEXT PRIMARY KEY, csl BLOB) WITHOUT ROWID"
+        )
+        # dump files already imported, so a rerun only reads new or changed ones
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS imports (path TEXT PRIMARY KEY, size INTEGER, mtime REAL)"
+        )
+        db.commit()
+        _local.db = db
+        _local.pid = pid
+    return _local.db
+
+
+def encode(csl):
+    return zlib.compress(json.dumps(csl, separators=(",", ":")).encode("utf-8"), 9)
+
+
+def get(doi):
+    """
+    The stored CSL-JSON for a DOI, or None.
+    """
+    db = get_db()
+    if db is None:
+        return None
+    try:
+        row = db.execute(
+            "SELECT csl FROM dois WHERE doi = ?", (doi.lower(),)
+        ).fetchone()
+    except sqlite3.Error as e:
+        print("doi store lookup failed for {}: {}".format(doi, e))
+        return None
+    return json.loads(zlib.decompress(row[0])) if row else None
+
+
+def put_many(records):
+    """
+    Stores CSL-JSON records, replacing earlier ones for the same DOI.
+    Returns how many were stored.
+    """
+    db = get_db(create=True)
+    count = 0
+    batch = []
+    for csl in records:
+        if not csl.get("DOI"):
+            continue
+        batch.append((csl["DOI"].lower(), encode(csl)))
+        if len(batch) == IMPORT_BATCH:
+            count += store_batch(db, batch)
+            batch = []
+    return count + store_batch(db, batch)
+
+
+def store_batch(db, batch):
+    with db:
+        db.executemany("INSERT OR REPLACE INTO dois (doi, csl) VALUES (?, ?)", batch)
+    return len(batch)
+
+
+def read_records(path):
+    """
+    Yields records from a JSON lines file, or from a JSON file holding a list or
+    a Crossref-style {"items": [...]}, either optionally gzipped.
+    """
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        first_line = f.readline()
+        try:
+            data = json.loads(first_line)
+        except ValueError:
+            # a pretty-printed file rather than one record per line
+            data = json.loads(first_line + f.read())
+        if isinstance(data, list):
+            yield from data
+            return
+        if "items" in data:
+            yield from data["items"]
+            return
+        yield data
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def import_files(paths, force=False):
+    """
+    Imports dump files into the store, skipping ones already imported unchanged.
+    Returns how many records were stored.
+    """
+    db = get_db(create=True)
+    total = 0
+    for path in paths:
+        stat = os.stat(path)
+        key = os.path.abspath(path)
+        done = db.execute(
+            "SELECT size, mtime FROM imports WHERE path = ?", (key,)
+        ).fetchone()
+        if done == (stat.st_size, stat.st_mtime) and not force:
+            print("skipping {}, already imported".format(path), file=sys.stderr)
+            continue
+        count = put_many(record_to_csl(record) for record in read_records(path))
+        with db:
+            db.execute(
+                "INSERT OR REPLACE INTO imports (path, size, mtime) VALUES (?, ?, ?)",
+                (key, stat.st_size, stat.st_mtime),
+            )
+        print("imported {} records from {}".format(count, path), file=sys.stderr)
+        total += count
+    return total
+
+
+def store_stats():
+    db = get_db()
+    if db is None:
+        return {"dois": 0, "files": 0}
+    return {
+        "dois": db.execute("SELECT COUNT(*) FROM dois").fetchone()[0],
+        "files": db.execute("SELECT COUNT(*) FROM imports").fetchone()[0],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage the local DOI store.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    import_parser = commands.add_parser("import", help="import dump files")
+    import_parser.add_argument("paths", nargs="+")
+    import_parser.add_argument(
+        "--force", action="store_true", help="import files even if already imported"
+    )
+    commands.add_parser("stats", help="count stored DOIs")
+    args = parser.parse_args(argv)
+
+    if args.command == "import":
+        import_files(args.paths, force=args.force)
+    print(json.dumps(store_stats()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+"""
+Background resolution jobs for POST /jobs, kept in a local SQLite queue so they
+outlive request timeouts and worker restarts.
+
+Each input of a job is a queue item. Workers lease an item, resolve it and store
+the result; an item whose lease runs out (its worker died) is picked up again.
+Web processes run a few worker threads themselves (CITEAS_JOB_THREADS), and
+`python jobs.py` runs a dedicated worker process.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from werkzeug.exceptions import HTTPException
+
+import product_cache
+from software import unsupported_input_message
+
+JOBS_PATH = os.environ.get("CITEAS_JOBS_PATH", "citeas_jobs.sqlite")
+# worker threads started inside each web process, 0 leaves the work to `python jobs.py`
+JOB_THREADS = int(os.environ.get("CITEAS_JOB_THREADS", 2))
+# longer than any resolution can take, so only dead workers lose their items
+LEASE_SECONDS = 5 * 60
+MAX_ATTEMPTS = 3
+POLL_SECONDS = 1
+RETENTION = 7 * 24 * 60 * 60
+
+_local = threading.local()
+_workers_pid = None
+_workers_lock = threading.Lock()
+
+
+def get_db():
+    pid = os.getpid()
+    if getattr(_local, "pid", None) != pid:
+        # autocommit, claims open their own IMMEDIATE transaction
+        db = sqlite3.connect(JOBS_PATH, timeout=30, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(
+            """CREATE TABLE IF NOT EXISTS job_items (
+                job_id TEXT,
+                idx INTEGER,
+                input TEXT,
+                status TEXT,
+                result TEXT,
+                attempts INTEGER DEFAULT 0,
+                lease_until REAL,
+                created_at REAL,
+                updated_at REAL,
+                PRIMARY KEY (job_id, idx)
+            )"""
+        )
+        db.execute(
+            "CREATE INDEX IF NOT EXISTS job_items_status ON job_items (status, created_at)"
+        )
+        db.execute(
+            "DELETE FROM job_items WHERE created_at < ?", (time.time() - RETENTION,)
+        )
+        _local.db = db
+        _local.pid = pid
+    return _local.db
+
+
+def submit(ids):
+    job_id = uuid.uuid4().hex
+    now = time.time()
+    db = get_db()
+    db.execute("BEGIN")
+    db.executemany(
+        "INSERT INTO job_items (job_id, idx, input, status, created_at, updated_at) "
+        "VALUES (?, ?, ?, 'queued', ?, ?)",
+        [(job_id, index, id, now, now) for index, id in enumerate(ids)],
+    )
+    db.execute("COMMIT")
+    return job_id
+
+
+def claim():
+    """
+    Leases the oldest waiting item, or one whose lease ran out.
+    Returns (job_id, idx, input), or None when there's nothing to do.
+    """
+    db = get_db()
+    now = time.time()
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        row = db.execute(
+            "SELECT job_id, idx, input FROM job_items "
+            "WHERE status = 'queued' OR (status = 'running' AND lease_until < ?) "
+            "ORDER BY created_at, idx LIMIT 1",
+            (now,),
+        ).fetchone()
+        if row is not None:
+            db.execute(
+                "UPDATE job_items SET status = 'running', lease_until = ?, "
+                "attempts = attempts + 1, updated_at = ? WHERE job_id = ? AND idx = ?",
+                (now + LEASE_SECONDS, now, row[0], row[1]),
+            )
+        db.execute("COMMIT")
+    except sqlite3.Error:
+        db.execute("ROLLBACK")
+        raise
+    return row
+
+
+def finish(job_id, idx, response):
+    status = "done" if "result" in response else "failed"
+    get_db().execute(
+        "UPDATE job_items SET status = ?, result = ?, lease_until = NULL, updated_at = ? "
+        "WHERE job_id = ? AND idx = ?",
+        (status, json.dumps(response, default=str), time.time(), job_id, idx),
+    )
+
+
+def release(job_id, idx, response, final_status="failed"):
+    """
+    Back in the queue for another try, unless it has already had its chances,
+    in which case it ends with final_status and this response.
+    """
+    get_db().execute(
+        "UPDATE job_items SET "
+        "status = CASE WHEN attempts >= ? THEN ? ELSE 'queued' END, "
+        "result = CASE WHEN attempts >= ? THEN ? ELSE NULL END, "
+        "lease_until = NULL, updated_at = ? WHERE job_id = ? AND idx = ?",
+        (
+            MAX_ATTEMPTS,
+            final_status,
+            MAX_ATTEMPTS,
+            json.dumps(response, default=str),
+            time.time(),
+            job_id,
+            idx,
+        ),
+    )
+
+
+def get_job(job_id):
+    rows = (
+        get_db()
+        .execute(
+            "SELECT idx, input, status, result FROM job_items WHERE job_id = ? ORDER BY idx",
+            (job_id,),
+        )
+        .fetchall()
+    )
+    if not rows:
+        return None
+
+    items = []
+    counts = {"queued": 0, "running": 0, "done": 0, "failed": 0}
+    for idx, input, status, result in rows:
+        item = {"index": idx, "id": input, "status": status}
+        if result:
+            item.update(json.loads(result))
+        items.append(item)
+        counts[status] += 1
+
+    if counts["queued"] == len(rows):
+        job_status = "queued"
+    elif counts["done"] + counts["failed"] == len(rows):
+        job_status = "done"
+    else:
+        job_status = "running"
+    return {"id": job_id, "status": job_status, "counts": counts, "items": items}
+
+
+def work_once():
+    """
+    Resolves one queue item. Returns False when the queue was empty.
+    """
+    item = claim()
+    if item is None:
+        return False
+    job_id, idx, input = item
+    error_message = unsupported_input_message(input)
+    if error_message:
+        finish(job_id, idx, {"error_message": error_message})
+        return True
+    try:
+        result = product_cache.resolve(input)
+    except HTTPException as e:
+        # steps reject bad input with abort(), trying again won't change that
+        finish(job_id, idx, {"error_message": e.description})
+    except Exception as e:
+        print("job {} item {} failed: {}".format(job_id, idx, e))
+        release(job_id, idx, {"error_message": "couldn't resolve this input"})
+    else:
+        if product_cache.is_complete(result):
+            finish(job_id, idx, {"result": result})
+        else:
+            # cut short by the deadline, a later try may get further
+            release(job_id, idx, {"result": result}, final_status="done")
+    return True
+
+
+def run_worker():
+    while True:
+        try:
+            if not work_once():
+                time.sleep(POLL_SECONDS)
+        except sqlite3.Error as e:
+            print("job queue error: {}".format(e))
+            time.sleep(POLL_SECONDS)
+
+
+def start_workers(threads=None):
+    """
+    Starts this process's worker threads, once per process.
+    """
+    global _workers_pid
+    threads = JOB_THREADS if threads is None else threads
+    with _workers_lock:
+        if _workers_pid == os.getpid():
+            return
+        _workers_pid = os.getpid()
+        for i in range(threads):
+            threading.Thread(
+                target=run_worker, name="citeas-job-{}".format(i), daemon=True
+            ).start()
+
+
+if __name__ == "__main__":
+    threads = int(os.environ.get("CITEAS_JOB_WORKER_THREADS", 4))
+    print("resolving jobs from {} with {} threads".format(JOBS_PATH, threads))
+    start_workers(threads)
+    while True:
+        time.sleep(60)
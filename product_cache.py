@@ -0,0 +1,163 @@
+"""
+Finished /product responses, kept in process so popular inputs skip the step walk.
+Fresh entries are returned as they are. Stale ones are still returned immediately
+while a background thread resolves the input again.
+"""
+from collections import OrderedDict
+import os
+import threading
+import time
+
+from canonical import canonical_id
+import single_flight
+from software import DEFAULT_TIMEOUT_MS, MAX_TIMEOUT_MS, Software
+from steps.user_input import UserInputStep
+
+HOUR = 60 * 60
+
+# seconds a result is served without question
+TTL = int(os.environ.get("CITEAS_PRODUCT_CACHE_TTL", 6 * HOUR))
+# seconds after that it is still served, while being refreshed
+STALE = int(os.environ.get("CITEAS_PRODUCT_CACHE_STALE", 7 * 24 * HOUR))
+# results kept, least recently used dropped first. 0 turns the cache off
+SIZE = int(os.environ.get("CITEAS_PRODUCT_CACHE_SIZE", 2000))
+
+stats = {"fresh_hits": 0, "stale_hits": 0, "misses": 0, "refreshes": 0}
+
+_entries = OrderedDict()
+_refreshing = set()
+_lock = threading.Lock()
+
+
+def cache_key(user_supplied_id):
+    # the same project entered as a doi url or a bare doi shares one entry
+    return canonical_id(user_supplied_id)
+
+
+def for_input(result, source_input, user_supplied_id):
+    """
+    A result resolved for source_input, as it would read for user_supplied_id:
+    inputs sharing a key can still differ in their url and first provenance step,
+    e.g. a repo's blob url and the repo itself. Worked out from the input alone,
+    without fetching anything.
+    """
+    if source_input == user_supplied_id:
+        return result
+    step = UserInputStep()
+    url = step.build_starting_url(user_supplied_id, probe=False)
+    if "readthedocs" in url:
+        # the citation page found for the same project, rather than probing again
+        url = result["url"]
+    first_step = dict(result["provenance"][0], content_url=url, key_word=step.key_word)
+    return dict(result, url=url, provenance=[first_step] + result["provenance"][1:])
+
+
+def get(user_supplied_id):
+    """
+    Returns the cached result for this input, or None.
+    A stale result starts a refresh in the background before it is returned.
+    """
+    if not SIZE:
+        return None
+    key = cache_key(user_supplied_id)
+    with _lock:
+        entry = _entries.get(key)
+        if entry is None:
+            stats["misses"] += 1
+            return None
+        result, stored_at, source_input = entry
+        age = time.time() - stored_at
+        if age < TTL:
+            _entries.move_to_end(key)
+            stats["fresh_hits"] += 1
+            return for_input(result, source_input, user_supplied_id)
+        if age >= TTL + STALE:
+            del _entries[key]
+            stats["misses"] += 1
+            return None
+        _entries.move_to_end(key)
+        stats["stale_hits"] += 1
+    start_refresh(user_supplied_id)
+    return for_input(result, source_input, user_supplied_id)
+
+
+def put(user_supplied_id, result):
+    if not SIZE:
+        return
+    key = cache_key(user_supplied_id)
+    with _lock:
+        _entries[key] = (result, time.time(), user_supplied_id)
+        _entries.move_to_end(key)
+        while len(_entries) > SIZE:
+            _entries.popitem(last=False)
+
+
+def is_complete(result):
+    # a resolution cut short by its deadline flags its last step
+    provenance = result["provenance"]
+    return not (provenance and provenance[-1]["partial"])
+
+
+def walk(user_supplied_id, timeout_ms=None):
+    my_software = Software(user_supplied_id, timeout_ms=timeout_ms)
+    my_software.find_metadata()
+    return my_software.to_dict()
+
+
+def resolve_now(user_supplied_id, timeout_ms=None):
+    # requests for an input that is already being resolved, here or in another
+    # worker, wait for that resolution instead of repeating it. It may have
+    # been for another input with the same key, so the input travels with it.
+    seconds = min(timeout_ms or DEFAULT_TIMEOUT_MS, MAX_TIMEOUT_MS) / 1000.0
+    give_up_at = time.monotonic() + seconds
+
+    def resolve_here():
+        # a follower that waited in vain only has what's left of its own time
+        remaining_ms = max(int((give_up_at - time.monotonic()) * 1000), 1)
+        return user_supplied_id, walk(user_supplied_id, remaining_ms)
+
+    source_input, result = single_flight.run(
+        cache_key(user_supplied_id),
+        resolve_here,
+        share=lambda resolved: is_complete(resolved[1]),
+        wait_seconds=seconds,
+    )
+    # partial results shouldn't stick around
+    if is_complete(result):
+        put(source_input, result)
+    return for_input(result, source_input, user_supplied_id)
+
+
+def resolve(user_supplied_id, timeout_ms=None):
+    """
+    Software.to_dict() for this input, from the cache when possible.
+    """
+    result = get(user_supplied_id)
+    if result is None:
+        result = resolve_now(user_supplied_id, timeout_ms)
+    return result
+
+
+def start_refresh(user_supplied_id):
+    key = cache_key(user_supplied_id)
+    with _lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+        stats["refreshes"] += 1
+
+    def refresh():
+        try:
+            resolve_now(user_supplied_id)
+        except Exception as e:
+            print("product cache refresh failed for {}: {}".format(key, e))
+        finally:
+            with _lock:
+                _refreshing.discard(key)
+
+    threading.Thread(target=refresh, daemon=True).start()
+
+
+def cache_stats():
+    with _lock:
+        return dict(stats, size=len(_entries), refreshing=len(_refreshing))
@@ -0,0 +1,228 @@
+"""
+Runs one resolution per canonical input at a time, across threads and across
+worker processes on the same machine. The first caller (the leader) does the
+work; callers arriving while it runs (followers) wait and get its result.
+
+Within a process followers wait on the leader's Future. Across processes the
+leader holds a row in a shared SQLite file and publishes its result there when
+done; followers poll for it, and run the work themselves if the leader fails,
+dies (its lease runs out) or the wait runs past their own timeout. Followers in
+the same process likewise run it themselves if the leader fails.
+"""
+from concurrent.futures import Future, TimeoutError
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from software import MAX_TIMEOUT_MS
+
+INFLIGHT_PATH = os.environ.get("CITEAS_INFLIGHT_PATH", "citeas_inflight.sqlite")
+# a little longer than any resolution can take, so only a dead leader's row expires
+LEASE_SECONDS = MAX_TIMEOUT_MS / 1000.0 + 5
+POLL_SECONDS = 0.1
+# published results are only for followers already waiting
+RESULT_SECONDS = 60
+
+stats = {"leaders": 0, "followers": 0, "shared": 0}
+
+_flights = {}
+_lock = threading.Lock()
+_local = threading.local()
+
+
+def get_db():
+    pid = os.getpid()
+    if getattr(_local, "pid", None) != pid:
+        db = sqlite3.connect(INFLIGHT_PATH, timeout=30, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(
+            """CREATE TABLE IF NOT EXISTS inflight (
+                key TEXT PRIMARY KEY,
+                owner TEXT,
+                lease_until REAL,
+                result TEXT,
+                finished_at REAL
+            )"""
+        )
+        _local.db = db
+        _local.pid = pid
+    return _local.db
+
+
+def owner_id():
+    return "{}:{}".format(os.getpid(), threading.get_ident())
+
+
+def is_held(row, now):
+    # a finished row is an old result, a lapsed lease a dead leader
+    return row is not None and row[1] is None and row[0] >= now
+
+
+def lead(key):
+    """
+    Takes the shared row for key. True if this caller is now the leader.
+    """
+    db = get_db()
+    now = time.time()
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        row = db.execute(
+            "SELECT lease_until, finished_at FROM inflight WHERE key = ?", (key,)
+        ).fetchone()
+        taken = is_held(row, now)
+        if not taken:
+            db.execute(
+                "INSERT OR REPLACE INTO inflight (key, owner, lease_until) VALUES (?, ?, ?)",
+                (key, owner_id(), now + LEASE_SECONDS),
+            )
+        db.execute("COMMIT")
+    except sqlite3.Error:
+        db.execute("ROLLBACK")
+        raise
+    return not taken
+
+
+def is_running(key):
+    """
+    Whether a resolution of key is under way, here or in another worker.
+    """
+    with _lock:
+        if key in _flights:
+            return True
+    try:
+        row = (
+            get_db()
+            .execute(
+                "SELECT lease_until, finished_at FROM inflight WHERE key = ?", (key,)
+            )
+            .fetchone()
+        )
+    except sqlite3.Error as e:
+        print("single flight unavailable for {}: {}".format(key, e))
+        return False
+    return is_held(row, time.time())
+
+
+def publish(key, result):
+    """
+    Hands result to the followers in other processes, or with None lets them
+    run it themselves.
+    """
+    db = get_db()
+    now = time.time()
+    try:
+        if result is None:
+            db.execute(
+                "DELETE FROM inflight WHERE key = ? AND owner = ?", (key, owner_id())
+            )
+        else:
+            db.execute(
+                "UPDATE inflight SET result = ?, finished_at = ?, lease_until = NULL "
+                "WHERE key = ? AND owner = ?",
+                (json.dumps(result, default=str), now, key, owner_id()),
+            )
+        db.execute(
+            "DELETE FROM inflight WHERE finished_at < ?", (now - RESULT_SECONDS,)
+        )
+    except sqlite3.Error as e:
+        # followers fall back to their own resolution when the lease runs out
+        print("couldn't publish single flight result for {}: {}".format(key, e))
+
+
+def wait_for_result(key, started_at, wait_seconds):
+    """
+    The result another process publishes for key, or None if it never comes.
+    """
+    db = get_db()
+    give_up_at = time.monotonic() + wait_seconds
+    while time.monotonic() < give_up_at:
+        row = db.execute(
+            "SELECT lease_until, result, finished_at FROM inflight WHERE key = ?",
+            (key,),
+        ).fetchone()
+        if row is None:
+            # the leader failed
+            return None
+        lease_until, result, finished_at = row
+        if finished_at is not None:
+            return json.loads(result) if finished_at >= started_at else None
+        if lease_until < time.time():
+            return None
+        time.sleep(POLL_SECONDS)
+    return None
+
+
+def run(key, fn, share=None, wait_seconds=None):
+    """
+    fn(), unless a resolution of the same key is already running here or in
+    another worker, in which case that one's result. Results share() rejects,
+    e.g. partial ones, go to the leader's caller only. Followers wait at most
+    wait_seconds, which should be their own deadline.
+    """
+    wait_seconds = LEASE_SECONDS if wait_seconds is None else wait_seconds
+    with _lock:
+        future = _flights.get(key)
+        leader = future is None
+        if leader:
+            future = Future()
+            _flights[key] = future
+            stats["leaders"] += 1
+        else:
+            stats["followers"] += 1
+
+    if not leader:
+        try:
+            result = future.result(timeout=wait_seconds)
+        except TimeoutError:
+            result = None
+        except Exception as e:
+            # the leader's failure may be its own, e.g. its deadline
+            print("single flight leader failed for {}: {}".format(key, e))
+            result = None
+        return fn() if result is None else result
+
+    try:
+        result = lead_across_processes(key, fn, share, wait_seconds)
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    else:
+        # None sends the followers here off to resolve it themselves
+        future.set_result(result if share is None or share(result) else None)
+        return result
+    finally:
+        with _lock:
+            del _flights[key]
+
+
+def lead_across_processes(key, fn, share, wait_seconds):
+    started_at = time.time()
+    try:
+        process_leader = lead(key)
+        if not process_leader:
+            result = wait_for_result(key, started_at, wait_seconds)
+            if result is not None:
+                with _lock:
+                    stats["shared"] += 1
+                return result
+            process_leader = lead(key)
+    except sqlite3.Error as e:
+        print("single flight unavailable for {}: {}".format(key, e))
+        process_leader = False
+
+    try:
+        result = fn()
+    except BaseException:
+        if process_leader:
+            publish(key, None)
+        raise
+    if process_leader:
+        publish(key, result if share is None or share(result) else None)
+    return result
+
+
+def flight_stats():
+    with _lock:
+        return dict(stats, in_flight=len(_flights))
@@ -1,29 +1,113 @@
+import os
+
 from citation import get_bib_source_from_dict, citations, reference_manager_exports
+from steps.deadline import Deadline
 from steps.user_input import UserInputStep
 from steps.exceptions import NoChildrenException
+from steps.page_store import PageStore
+from steps.webpage import WebpageMetadataStep
+
+# time budget for one resolution, keep it under the gunicorn worker timeout
+DEFAULT_TIMEOUT_MS = int(os.environ.get("CITEAS_TIMEOUT_MS", 45000))
+MAX_TIMEOUT_MS = int(os.environ.get("CITEAS_MAX_TIMEOUT_MS", 55000))
+
+# load sibling steps in parallel threads instead of one after another
+PREFETCH = os.environ.get("CITEAS_PREFETCH", "") == "1"
+
+
+def unsupported_input_message(user_supplied_id):
+    if user_supplied_id.endswith(".pdf"):
+        return "PDF documents are not supported."
+    if user_supplied_id.endswith((".doc", "docx")):
+        return "Word documents are not supported."
+    return None
 
 
 class Software(object):
-    def __init__(self, user_supplied_id):
+    def __init__(self, user_supplied_id, timeout_ms=None, prefetch=None):
         self.user_supplied_id = user_supplied_id
         self.completed_steps = []
+        self.page_store = PageStore()
+        timeout_ms = min(timeout_ms or DEFAULT_TIMEOUT_MS, MAX_TIMEOUT_MS)
+        self.deadline = Deadline.from_ms(timeout_ms)
+        self.prefetch = PREFETCH if prefetch is None else prefetch
 
-    def find_metadata(self):
+    @property
+    def partial(self):
+        return bool(self.completed_steps) and self.completed_steps[-1].partial
+
+    def add_user_input_step(self):
         my_step = UserInputStep()
+        my_step.page_store = self.page_store
+        my_step.deadline = self.deadline
+        my_step.prefetch = self.prefetch
         my_step.set_content_url(self.user_supplied_id)
         my_step.set_content(self.user_supplied_id)
         self.completed_steps.append(my_step)
 
+    def is_done(self):
+        if self.completed_steps[-1].is_metadata:
+            return True
+        if self.deadline.expired:
+            self.completed_steps.append(self.fallback_metadata_step())
+            return True
+        return False
+
+    def find_metadata(self):
+        for step in self.iter_steps():
+            pass
+
+    def iter_steps(self):
+        """
+        The find_metadata walk as a generator, yielding each step once it has its content.
+        Closing the generator early stops the walk.
+        """
+        self.add_user_input_step()
+        yield self.completed_steps[0]
+
         cursor = 0
-        while not self.completed_steps[-1].is_metadata:
-            current_step = self.completed_steps[cursor]
+        try:
+            while not self.is_done():
+                current_step = self.completed_steps[cursor]
 
-            try:
-                next_step = current_step.get_child()
-                self.completed_steps.append(next_step)
-                cursor = len(self.completed_steps) - 1
-            except NoChildrenException:
-                cursor -= 1
+                try:
+                    next_step = current_step.get_child()
+                    self.completed_steps.append(next_step)
+                    cursor = len(self.completed_steps) - 1
+                    yield next_step
+                except NoChildrenException:
+                    cursor -= 1
+
+            if self.partial:
+                # is_done added the fallback step
+                yield self.completed_steps[-1]
+        finally:
+            self.cancel_prefetch()
+
+    def cancel_prefetch(self):
+        for step in self.completed_steps:
+            step.cancel_prefetch()
+
+    def fallback_metadata_step(self):
+        # out of time: describe the most recent web page we already downloaded
+        source_step = self.completed_steps[0]
+        for step in reversed(self.completed_steps):
+            if isinstance(step.content, str) and "<title" in step.content.lower():
+                source_step = step
+                break
+
+        my_step = WebpageMetadataStep()
+        my_step.parent = source_step
+        my_step.set_content_url(source_step.content_url)
+        if (
+            isinstance(source_step.content, str)
+            and source_step is not self.completed_steps[0]
+        ):
+            my_step.set_content(source_step.content)
+        else:
+            my_step.set_content("")
+        my_step.partial = True
+        return my_step
 
     @property
     def name(self):
@@ -1,7 +1,8 @@
 import re
 
-from arxiv2bib import arxiv2bib_dict, is_valid
+from arxiv2bib import is_valid
 
+from steps.arxiv_lookup import lookup
 from steps.core import MetadataStep, Step
 from steps.utils import author_name_as_dict
 
@@ -29,8 +30,10 @@ class ArxivResponseStep(Step):
         if not is_valid(input):
             return
 
-        response = arxiv2bib_dict([input])
-        my_reference = response[input]
+        # batched with other lookups running at the same time
+        my_reference = lookup(input, deadline=self.deadline)
+        if my_reference is None:
+            return
         self.content = {}
         try:
             self.content["title"] = re.sub("\s+", " ", my_reference.title)
@@ -0,0 +1,308 @@
+"""
+arXiv API lookups coalesced into batch queries.
+
+Concurrent resolutions asking for arXiv ids within a short window share one
+query of up to BATCH_SIZE ids, and queries are spaced out per arXiv's API policy:
+each query books the next free slot, and lookups arriving before it comes up join
+it. A lookup with no others in progress skips the window. Slots are booked in a
+SQLite file shared by every process on the machine, so workers, job threads and
+bulk runs keep to the interval together.
+Entries are cached by versioned and bare id, in process and in the shared http
+cache, so other workers and later runs find them too.
+"""
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError
+import os
+import sqlite3
+import threading
+import time
+from xml.etree import ElementTree
+
+from arxiv2bib import ATOM, NotFoundError, Reference
+import requests
+
+from canonical import arxiv_re
+from steps import http_cache
+from steps.fetch import http_get
+
+ARXIV_API_URL = os.environ.get(
+    "CITEAS_ARXIV_API_URL", "http://export.arxiv.org/api/query"
+)
+# how long a lookup waits for others to join its query, when there are others
+WINDOW = float(os.environ.get("CITEAS_ARXIV_WINDOW_MS", 50)) / 1000
+BATCH_SIZE = int(os.environ.get("CITEAS_ARXIV_BATCH_SIZE", 100))
+# arXiv asks for no more than one query every three seconds
+MIN_INTERVAL = float(os.environ.get("CITEAS_ARXIV_MIN_INTERVAL", 3))
+SLOTS_PATH = os.environ.get("CITEAS_ARXIV_SLOTS_PATH", "citeas_arxiv_slots.sqlite")
+CACHE_SIZE = 5000
+ENTRY_TYPE = "application/atom+xml"
+
+
+_local = threading.local()
+
+
+def get_db():
+    pid = os.getpid()
+    if getattr(_local, "pid", None) != pid:
+        db = sqlite3.connect(SLOTS_PATH, timeout=30, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS slots (name TEXT PRIMARY KEY, next_at REAL)"
+        )
+        _local.db = db
+        _local.pid = pid
+    return _local.db
+
+
+def book_slot(window=0):
+    """
+    Books the first query slot after every other process's, no sooner than
+    window from now. Returns the seconds until it.
+    """
+    db = get_db()
+    now = time.time()
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        row = db.execute("SELECT next_at FROM slots WHERE name = 'arxiv'").fetchone()
+        start_at = max(now + window, row[0] if row else 0)
+        db.execute(
+            "INSERT OR REPLACE INTO slots (name, next_at) VALUES ('arxiv', ?)",
+            (start_at + MIN_INTERVAL,),
+        )
+        db.execute("COMMIT")
+    except sqlite3.Error:
+        db.execute("ROLLBACK")
+        raise
+    return start_at - now
+
+
+def entry_url(arxiv_id):
+    # the single-id query, the key entries are kept under in the http cache
+    return "{}?id_list={}&max_results=1".format(ARXIV_API_URL, arxiv_id)
+
+
+def fetch_references(ids, deadline=None):
+    """
+    One arXiv API query for many ids. Returns {id: Reference}, keyed by both
+    versioned and bare ids like arxiv2bib_dict.
+    """
+    ids = list(ids)
+    while ids:
+        r = http_get(
+            "{}?id_list={}&max_results={}".format(
+                ARXIV_API_URL, ",".join(ids), len(ids)
+            ),
+            use_cache=False,
+            deadline=deadline,
+        )
+        r.raise_for_status()
+        try:
+            entries = ElementTree.fromstring(r.content).findall(ATOM + "entry")
+        except ElementTree.ParseError:
+            raise requests.exceptions.RequestException(
+                "couldn't parse the arXiv response"
+            )
+        title = entries[0].find(ATOM + "title") if entries else None
+        if title is None or title.text.strip() != "Error":
+            break
+        # one malformed id fails the whole query, drop it and ask again
+        bad_id = entries[0].find(ATOM + "summary").text.split()[-1]
+        if bad_id not in ids:
+            return {}
+        ids.remove(bad_id)
+    if not ids:
+        return {}
+
+    refs = {}
+    for entry in entries:
+        try:
+            ref = Reference(entry)
+        except NotFoundError:
+            continue
+        refs[ref.id] = ref
+        if ref.bare_id not in refs or refs[ref.bare_id].updated < ref.updated:
+            refs[ref.bare_id] = ref
+    return refs
+
+
+class ArxivLookup(object):
+    def __init__(self, window=WINDOW, batch_size=BATCH_SIZE):
+        self.window = window
+        self.batch_size = batch_size
+        # id -> Future for lookups waiting on the next query
+        self.pending = OrderedDict()
+        self.cache = OrderedDict()
+        self.queries = 0
+        # lookups waiting on a query, sent or not
+        self.active = 0
+        self.next_query_at = 0
+        self.lock = threading.Lock()
+
+    def get(self, arxiv_id, deadline=None, retry=True):
+        """
+        The Reference for an arXiv id, or None if arXiv doesn't know it.
+        """
+        ref = self.cached(arxiv_id)
+        if ref is not None:
+            return ref
+
+        with self.lock:
+            future = self.pending.get(arxiv_id)
+            # the first lookup of a batch sends the query when its slot comes up
+            leader = not self.pending
+            if future is None:
+                future = Future()
+                self.pending[arxiv_id] = future
+            full = len(self.pending) >= self.batch_size
+            # on its own a lookup has no one to wait for
+            window = self.window if self.active else 0
+            self.active += 1
+        try:
+            if full:
+                self.flush(deadline)
+            elif leader:
+                self.flush(deadline, window)
+            return future.result(
+                timeout=deadline.remaining() if deadline is not None else None
+            )
+        except TimeoutError:
+            raise requests.exceptions.Timeout(
+                "resolution deadline exceeded waiting for arXiv"
+            )
+        except requests.exceptions.Timeout:
+            # the query ran on the deadline of the lookup that sent it
+            if leader or not retry or (deadline is not None and deadline.expired):
+                raise
+            return self.get(arxiv_id, deadline, retry=False)
+        finally:
+            with self.lock:
+                self.active -= 1
+
+    def get_many(self, ids, deadline=None):
+        """
+        Looks up a known list of ids, e.g. a whole batch, without waiting for a window.
+        """
+        missing = [id for id in dict.fromkeys(ids) if self.cached(id) is None]
+        for i in range(0, len(missing), self.batch_size):
+            wait = self.reserve()
+            remaining = deadline.remaining() if deadline is not None else None
+            if remaining is not None and remaining < wait:
+                raise requests.exceptions.Timeout(
+                    "resolution deadline exceeded waiting for arXiv"
+                )
+            time.sleep(wait)
+            self.query(missing[i : i + self.batch_size], deadline)
+
+    def reserve(self, window=0):
+        """
+        Books the first query slot arXiv's interval allows, no sooner than window
+        from now. Returns the seconds until it.
+        """
+        try:
+            return book_slot(window)
+        except sqlite3.Error as e:
+            # keep to the interval in this process at least
+            print("shared arxiv slots unavailable: {}".format(e))
+        with self.lock:
+            now = time.monotonic()
+            start_at = max(now + window, self.next_query_at)
+            self.next_query_at = start_at + MIN_INTERVAL
+        return start_at - now
+
+    def flush(self, deadline=None, window=0):
+        # sleeping outside the lock lets other ids join, and queries for other
+        # batches book their own slots meanwhile
+        wait = self.reserve(window)
+        remaining = deadline.remaining() if deadline is not None else None
+        late = remaining is not None and remaining < wait
+        if not late:
+            time.sleep(wait)
+        with self.lock:
+            batch = list(self.pending.items())[: self.batch_size]
+            for arxiv_id, future in batch:
+                del self.pending[arxiv_id]
+        if not batch:
+            return
+        try:
+            if late:
+                raise requests.exceptions.Timeout(
+                    "resolution deadline exceeded waiting for arXiv"
+                )
+            refs = self.query([arxiv_id for arxiv_id, future in batch], deadline)
+        except Exception as e:
+            for arxiv_id, future in batch:
+                future.set_exception(e)
+            return
+        for arxiv_id, future in batch:
+            future.set_result(refs.get(arxiv_id))
+
+    def query(self, ids, deadline=None):
+        with self.lock:
+            self.queries += 1
+        refs = fetch_references(ids, deadline)
+        for arxiv_id, ref in refs.items():
+            self.remember(arxiv_id, ref)
+            http_cache.seed(
+                entry_url(arxiv_id), None, ElementTree.tostring(ref.xml), ENTRY_TYPE
+            )
+        return refs
+
+    def cached(self, arxiv_id):
+        with self.lock:
+            ref = self.cache.get(arxiv_id)
+            if ref is not None:
+                self.cache.move_to_end(arxiv_id)
+                return ref
+        # another process may have looked it up already
+        entry = http_cache.lookup(entry_url(arxiv_id))
+        if entry is None or not entry.fresh:
+            return None
+        try:
+            ref = Reference(ElementTree.fromstring(entry.body))
+        except (ElementTree.ParseError, NotFoundError):
+            return None
+        self.remember(arxiv_id, ref)
+        return ref
+
+    def remember(self, arxiv_id, ref):
+        with self.lock:
+            self.cache[arxiv_id] = ref
+            self.cache.move_to_end(arxiv_id)
+            while len(self.cache) > CACHE_SIZE:
+                self.cache.popitem(last=False)
+
+
+_lookup = None
+_lookup_lock = threading.Lock()
+
+
+def get_arxiv_lookup():
+    global _lookup
+    if _lookup is None:
+        with _lookup_lock:
+            if _lookup is None:
+                _lookup = ArxivLookup()
+    return _lookup
+
+
+def lookup(arxiv_id, deadline=None):
+    return get_arxiv_lookup().get(arxiv_id, deadline)
+
+
+def prefetch(user_supplied_ids, deadline=None):
+    """
+    Looks up the arXiv ids among these inputs in as few queries as possible,
+    before they're resolved one by one, giving up at the deadline.
+    """
+    ids = []
+    for user_supplied_id in user_supplied_ids:
+        match = arxiv_re.match(user_supplied_id.strip())
+        if match:
+            ids.append(match.group(1).lower())
+    if len(ids) < 2:
+        return
+    try:
+        get_arxiv_lookup().get_many(ids, deadline)
+    except Exception as e:
+        # only ever a head start, the steps will look the ids up themselves
+        print("arxiv prefetch failed: {}".format(e))
@@ -1,8 +1,6 @@
 from io import StringIO
 import re
 
-import requests
-
 from bibtex import BibTeX  # use local patched version instead of citeproc.source.bibtex
 from steps.core import MetadataStep, Step
 from steps.utils import extract_bibtex, get_bibtex_url
@@ -26,12 +24,12 @@ class BibtexStep(Step):
         else:
             my_bibtex_url = get_bibtex_url(input)
             if my_bibtex_url:
-                r = requests.get(my_bibtex_url)
+                text = self.get_webpage_text(my_bibtex_url)
                 if my_bibtex_url.startswith("https://vhub.org"):
-                    self.content = r.text
+                    self.content = text
                     self.content_url = my_bibtex_url.replace("amp;", "")
                 else:
-                    self.content = extract_bibtex(r.text)
+                    self.content = extract_bibtex(text)
 
 
 class BibtexMetadataStep(MetadataStep):
@@ -5,7 +5,7 @@ from steps.citation import CitationFileStep
 from steps.codemeta import CodemetaResponseStep
 from steps.core import Step
 from steps.crossref import CrossrefResponseStep
-from steps.utils import find_or_empty_string, get_raw_bitbucket_url, get_webpage_text
+from steps.utils import find_or_empty_string, get_raw_bitbucket_url
 
 
 class BitbucketRepoStep(Step):
@@ -40,7 +40,7 @@ class BitbucketRepoStep(Step):
                 url = "/".join(url.split("/")[0:5])
                 url = url + "/src"
 
-        self.content = get_webpage_text(url)
+        self.content = self.get_webpage_text(url)
         self.content_url = url
 
     def set_content_url(self, input):
@@ -70,7 +70,7 @@ class BitbucketReadmeFileStep(Step):
             filename_part = matches[0]
             filename = get_raw_bitbucket_url(filename_part)
 
-            self.content = get_webpage_text(filename)
+            self.content = self.get_webpage_text(filename)
             self.content_url = filename
 
     def set_content_url(self, input):
@@ -97,7 +97,7 @@ class BitbucketCodemetaFileStep(Step):
             filename_part = matches[0]
             filename = get_raw_bitbucket_url(filename_part)
 
-            self.content = get_webpage_text(filename)
+            self.content = self.get_webpage_text(filename)
             self.content_url = filename
 
     def set_content_url(self, input):
@@ -115,7 +115,7 @@ class BitbucketCitationFileStep(CitationFileStep):
             filename_part = matches[0]
             filename = get_raw_bitbucket_url(filename_part)
 
-            self.content = get_webpage_text(filename)
+            self.content = self.get_webpage_text(filename)
             self.content_url = filename
 
 
@@ -129,5 +129,5 @@ class BitbucketDescriptionFileStep(CitationFileStep):
             filename_part = matches[0]
             filename = get_raw_bitbucket_url(filename_part)
 
-            self.content = get_webpage_text(filename)
+            self.content = self.get_webpage_text(filename)
             self.content_url = filename
@@ -1,11 +1,17 @@
+import requests
+
+from steps.deadline import Deadline
 from steps.exceptions import NoChildrenException
-from steps.utils import get_all_subclasses, get_subject
+from steps.fetch import get_executor
+from steps.utils import get_all_subclasses, get_subject, get_webpage
 
 
 class Step(object):
     step_links = None
     step_intro = ""
     step_more = ""
+    # in prefetch mode, load all remaining children in parallel as soon as the first is asked for
+    prefetch_children = False
 
     @classmethod
     def config_dict(cls):
@@ -28,6 +34,14 @@ class Step(object):
         self.key_word = None
         self.source_preview = {"title": None}
         self.original_url = None
+        self.hops = None
+        self.page_store = None
+        self.deadline = None
+        self.prefetch = False
+        self.speculative_children = None
+        self.partial = False
+        self.page_store_hits = 0
+        self.page_store_misses = 0
 
     @property
     def starting_children(self):
@@ -38,7 +52,7 @@ class Step(object):
     def is_metadata(self):
         return False
 
-    def get_child(self):
+    def next_child(self):
         if not self.content:
             # print "no content"
             raise NoChildrenException
@@ -48,13 +62,80 @@ class Step(object):
             raise NoChildrenException
 
         child_class = self.remaining_children.pop(0)
+        return self.make_child(child_class)
+
+    def make_child(self, child_class):
         child_obj = child_class()
         child_obj.parent = self
-        child_obj.set_content_url(self.content_url)
-        child_obj.set_content(self.content)
+        child_obj.page_store = self.page_store
+        child_obj.deadline = self.deadline
+        child_obj.prefetch = self.prefetch
+        return child_obj
+
+    def load_child(self, child_obj):
+        try:
+            child_obj.set_content_url(self.content_url)
+            child_obj.set_content(self.content)
+        except requests.exceptions.RequestException as e:
+            child_obj.fetch_failed(e)
 
+    def get_child(self):
+        if self.prefetch and self.prefetch_children and self.content:
+            if self.speculative_children is None:
+                self.start_prefetch()
+            if self.speculative_children:
+                # still handed out in priority order, so the result matches a sequential walk
+                self.remaining_children.pop(0)
+                child_obj, future = self.speculative_children.pop(0)
+                future.result()
+                return child_obj
+
+        child_obj = self.next_child()
+        self.load_child(child_obj)
         return child_obj
 
+    def start_prefetch(self):
+        self.speculative_children = []
+        for child_class in self.remaining_children:
+            child_obj = self.make_child(child_class)
+            # its own deadline so unused speculative work can be called off
+            child_obj.deadline = (self.deadline or Deadline()).derive()
+            future = get_executor().submit(self.load_child, child_obj)
+            self.speculative_children.append((child_obj, future))
+
+    def cancel_prefetch(self):
+        for child_obj, future in self.speculative_children or []:
+            future.cancel()
+            child_obj.deadline.cancel()
+        self.speculative_children = []
+
+    def fetch_failed(self, e):
+        # an upstream that times out or refuses just means this step has nothing
+        print("fetch failed in {}: {}".format(self.get_name(), e))
+        self.content = None
+
+    def get_webpage(self, url, until=None):
+        if self.page_store is None:
+            page = get_webpage(url, deadline=self.deadline, until=until)
+        else:
+            page, hit = self.page_store.get_page(
+                url, deadline=self.deadline, until=until
+            )
+            if hit:
+                self.page_store_hits += 1
+            else:
+                self.page_store_misses += 1
+        if page is not None and len(page.hops) > 1:
+            # keep the redirect chain so provenance shows where the content really came from
+            self.hops = page.hops
+        return page
+
+    def get_webpage_text(self, url, until=None):
+        page = self.get_webpage(url, until=until)
+        if page is None:
+            return None
+        return page.text
+
     def get_name(self):
         return self.__class__.__name__
 
@@ -118,6 +199,12 @@ class Step(object):
             "source_preview": self.source_preview,
             "original_url": self.original_url,
             "key_word": self.key_word,
+            "hops": self.hops,
+            "partial": self.partial,
+            "page_store": {
+                "hits": self.page_store_hits,
+                "misses": self.page_store_misses,
+            },
         }
         return ret
 
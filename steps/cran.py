@@ -1,5 +1,4 @@
-import requests
-
+import cran_index
 from steps.bibtex import BibtexStep
 from steps.bitbucket import BitbucketRepoStep
 from steps.citation import CitationFileStep
@@ -8,7 +7,12 @@ from steps.crossref import CrossrefResponseStep
 from steps.description import DescriptionFileStep
 from steps.github import GithubRepoStep
 from steps.pmid import PMIDStep
-from steps.utils import find_or_empty_string, get_webpage_text
+from steps.utils import find_or_empty_string
+
+
+def indexed_package(package_url):
+    # package urls end in the package name, see CranLibraryStep.set_content_url
+    return cran_index.get(package_url.rstrip("/").rsplit("/", 1)[-1])
 
 
 class CranLibraryStep(Step):
@@ -32,7 +36,12 @@ class CranLibraryStep(Step):
 
     def set_content(self, input):
         if self.content_url:
-            self.content = get_webpage_text(self.content_url)
+            entry = indexed_package(self.content_url)
+            if entry:
+                # has the URL and BugReports links the package page would show
+                self.content = entry["description"]
+                return
+            self.content = self.get_webpage_text(self.content_url)
 
     def set_content_url(self, input):
         if input and "cran.r-project.org/web/packages" in input:
@@ -55,16 +64,28 @@ class CranLibraryStep(Step):
 class CranCitationFileStep(CitationFileStep):
     def set_content(self, cran_main_page_text):
         cran_citation_url = self.parent_content_url + "/citation.html"
-        r = requests.get(cran_citation_url)
+        entry = indexed_package(self.parent_content_url)
+        if entry and entry["has_citation"] is False:
+            return
+        if entry and entry["citation"]:
+            self.content = entry["citation"]
+            self.content_url = cran_citation_url
+            return
+        page = self.get_webpage(cran_citation_url)
 
-        if r.status_code == 200:
-            self.content = r.text
+        if page and page.status_code == 200:
+            self.content = page.text
             self.content_url = cran_citation_url
 
 
 class CranDescriptionFileStep(DescriptionFileStep):
     def set_content(self, input):
         filename = self.parent_content_url + "/DESCRIPTION"
-        page = get_webpage_text(filename)
+        entry = indexed_package(self.parent_content_url)
+        if entry:
+            self.content = entry["description"]
+            self.content_url = filename
+            return
+        page = self.get_webpage_text(filename)
         self.content = page
         self.content_url = filename
@@ -1,10 +1,17 @@
 import re
 
-import requests
-import requests_cache
-
+import doi_store
 from steps.core import MetadataStep, Step
-from steps.utils import clean_doi, find_or_empty_string, get_webpage_text
+from steps.fetch import http_get
+from steps.utils import clean_doi, find_or_empty_string
+
+# what extract_doi looks for on zenodo pages, enough to stop downloading the rest.
+# Each ends on a character that can't be part of the match so no digits are cut off.
+ZENODO_DOI_UNTIL = (
+    r"zenodo\.org/badge/doi/.+?\.svg"
+    r"|zenodo\.org/badge/latestdoi/\d+\D"
+    r"|10\.5281/zenodo\.\d+\D"
+)
 
 
 class CrossrefResponseStep(Step):
@@ -39,14 +46,20 @@ class CrossrefResponseStep(Step):
 
     def extract_doi(self, text):
         if text.startswith("https://zenodo.org/record/"):
-            text = get_webpage_text(text)
+            text = self.get_webpage_text(text, until=ZENODO_DOI_UNTIL)
+            if not text:
+                return None
 
         badge_doi_1 = find_or_empty_string("://zenodo.org/badge/doi/(.+?).svg", text)
         if badge_doi_1:
             return self.strip_junk_from_end_of_doi(badge_doi_1)
         badge_doi_2 = find_or_empty_string("zenodo.org/badge/latestdoi/\d+", text)
         if badge_doi_2:
-            text = get_webpage_text("https://" + badge_doi_2)
+            text = self.get_webpage_text(
+                "https://" + badge_doi_2, until=ZENODO_DOI_UNTIL
+            )
+            if not text:
+                return None
         zenodo_doi = find_or_empty_string("10\.5281\/zenodo\.\d+", text)
         if zenodo_doi:
             return self.strip_junk_from_end_of_doi(zenodo_doi)
@@ -68,12 +81,15 @@ class CrossrefResponseStep(Step):
         doi_url = self.content_url
         if not doi_url:
             return
+        stored = doi_store.get(doi_url.split("doi.org/", 1)[1])
+        if stored:
+            self.content = dict(stored, URL=doi_url)
+            return
         try:
-            with requests_cache.disabled():
-                headers = {"Accept": "application/vnd.citationstyles.csl+json"}
-                r = requests.get(doi_url, headers=headers)
-                self.content = r.json()
-                self.content["URL"] = doi_url
+            headers = {"Accept": "application/vnd.citationstyles.csl+json"}
+            r = http_get(doi_url, headers=headers, deadline=self.deadline)
+            self.content = r.json()
+            self.content["URL"] = doi_url
         except Exception:
             print("no doi metadata found for {}".format(doi_url))
 
@@ -98,8 +114,8 @@ class CrossrefResponseStep(Step):
                 has_doi = True
             elif input.startswith("http") and "github.com" in input:
                 # find zenodo badges in github repositories
-                content = get_webpage_text(input)
-                doi = self.extract_doi(content)
+                content = self.get_webpage_text(input, until=ZENODO_DOI_UNTIL)
+                doi = self.extract_doi(content) if content else None
                 if doi:
                     input = doi
                     has_doi = True
@@ -0,0 +1,49 @@
+import time
+
+
+class Deadline(object):
+    """
+    Time budget for one resolution, shared by every step and fetch in it.
+    """
+
+    def __init__(self, seconds=None):
+        self.expires_at = time.monotonic() + seconds if seconds else None
+        self.cancelled = False
+
+    @classmethod
+    def from_ms(cls, ms):
+        return cls(ms / 1000.0 if ms else None)
+
+    def derive(self):
+        # same expiry, but can be cancelled on its own, e.g. for speculative work
+        deadline = Deadline()
+        deadline.expires_at = self.expires_at
+        return deadline
+
+    def cancel(self):
+        self.cancelled = True
+
+    def remaining(self):
+        if self.cancelled:
+            return 0
+        if self.expires_at is None:
+            return None
+        return max(self.expires_at - time.monotonic(), 0)
+
+    @property
+    def expired(self):
+        return self.remaining() == 0
+
+    def cap_timeout(self, timeout):
+        """
+        Shrinks a requests-style timeout (seconds or a (connect, read) tuple)
+        so no single fetch outlives the deadline.
+        """
+        remaining = self.remaining()
+        if remaining is None:
+            return timeout
+        if timeout is None:
+            return remaining
+        if isinstance(timeout, tuple):
+            return tuple(min(t, remaining) for t in timeout)
+        return min(timeout, remaining)
@@ -0,0 +1,321 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import os
+import re
+import threading
+import urllib.parse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from steps import http_cache
+
+# one browser-like user agent for every upstream, some project pages refuse
+# anything that looks like a script
+USER_AGENT = (
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_11_5) "
+    "AppleWebKit/537.36 (KHTML, like Gecko) "
+    "Chrome/50.0.2661.102 Safari/537.36"
+)
+
+# (connect, read) in seconds, used when a caller doesn't pass its own timeout
+DEFAULT_TIMEOUT = (
+    float(os.environ.get("CITEAS_CONNECT_TIMEOUT", 5)),
+    float(os.environ.get("CITEAS_READ_TIMEOUT", 20)),
+)
+
+# requests in flight to any one host from this process, so batches don't hammer an upstream
+HOST_CONCURRENCY = int(os.environ.get("CITEAS_HOST_CONCURRENCY", 8))
+
+# keep-alive connections kept open per host, at least one per host slot so no
+# request waits on the pool after getting its slot
+POOL_MAXSIZE = max(int(os.environ.get("CITEAS_POOL_MAXSIZE", 16)), HOST_CONCURRENCY)
+
+# threads for speculative step fetches and GitHub snapshot files. More threads
+# than pooled connections would only queue for a connection.
+FETCH_THREADS = int(os.environ.get("CITEAS_FETCH_THREADS", POOL_MAXSIZE))
+
+# redirect chains longer than this are almost always a misconfigured site
+MAX_HOPS = 10
+
+MB = 1024 * 1024
+# most bytes read from one response, by content type prefix, first match wins.
+# Project pages and metadata never come close, anything bigger is a dump or a binary.
+MAX_BYTES = [
+    ("text/html", int(os.environ.get("CITEAS_MAX_HTML_BYTES", 2 * MB))),
+    ("application/json", 16 * MB),
+    ("application/vnd.citationstyles.csl+json", 5 * MB),
+    # arXiv API feeds, up to a hundred entries per query
+    ("application/atom+xml", 16 * MB),
+    ("text/", 2 * MB),
+    (None, int(os.environ.get("CITEAS_MAX_OTHER_BYTES", MB // 2))),
+]
+# never worth downloading to look for citation metadata
+BINARY_TYPES = (
+    "image/",
+    "audio/",
+    "video/",
+    "font/",
+    "application/pdf",
+    "application/zip",
+    "application/gzip",
+    "application/x-gzip",
+    "application/x-tar",
+    "application/x-bzip2",
+    "application/x-xz",
+    "application/x-7z-compressed",
+    "application/java-archive",
+    "application/msword",
+    "application/vnd.ms-",
+    "application/vnd.openxmlformats",
+)
+CHUNK_SIZE = 64 * 1024
+# bytes of the previous chunk searched again, so an `until` match can straddle chunks
+UNTIL_OVERLAP = 4 * 1024
+
+meta_refresh_re = re.compile("<meta[^>]*?url=(.*?)[\"']", re.IGNORECASE)
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+_executor = None
+_executor_pid = None
+_host_semaphores = {}
+_host_semaphores_pid = None
+
+
+def build_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=32, pool_maxsize=POOL_MAXSIZE)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers["User-Agent"] = USER_AGENT
+    return session
+
+
+def get_session():
+    """
+    Returns the session shared by every step in this worker process.
+    Built lazily, and rebuilt after a fork so gunicorn workers never share sockets.
+    """
+    global _session, _session_pid
+    pid = os.getpid()
+    if _session is None or _session_pid != pid:
+        with _session_lock:
+            if _session is None or _session_pid != pid:
+                _session = build_session()
+                _session_pid = pid
+    return _session
+
+
+def get_executor():
+    global _executor, _executor_pid
+    pid = os.getpid()
+    if _executor is None or _executor_pid != pid:
+        with _session_lock:
+            if _executor is None or _executor_pid != pid:
+                _executor = ThreadPoolExecutor(
+                    max_workers=FETCH_THREADS, thread_name_prefix="citeas"
+                )
+                _executor_pid = pid
+    return _executor
+
+
+@contextmanager
+def host_slot(url, deadline=None):
+    """
+    Holds one of the HOST_CONCURRENCY slots for the url's host, waiting no longer
+    than the deadline allows.
+    """
+    global _host_semaphores, _host_semaphores_pid
+    host = (urllib.parse.urlsplit(url).hostname or "").lower()
+    with _session_lock:
+        if _host_semaphores_pid != os.getpid():
+            _host_semaphores = {}
+            _host_semaphores_pid = os.getpid()
+        semaphore = _host_semaphores.get(host)
+        if semaphore is None:
+            semaphore = threading.BoundedSemaphore(HOST_CONCURRENCY)
+            _host_semaphores[host] = semaphore
+    timeout = deadline.remaining() if deadline is not None else None
+    if not semaphore.acquire(timeout=timeout):
+        raise requests.exceptions.Timeout(
+            "resolution deadline exceeded waiting for {}".format(host)
+        )
+    try:
+        yield
+    finally:
+        semaphore.release()
+
+
+def apply_deadline(kwargs, deadline):
+    kwargs.setdefault("timeout", DEFAULT_TIMEOUT)
+    if deadline is not None:
+        if deadline.expired:
+            raise requests.exceptions.Timeout("resolution deadline exceeded")
+        kwargs["timeout"] = deadline.cap_timeout(kwargs["timeout"])
+
+
+def max_bytes_for(content_type):
+    content_type = (content_type or "").lower()
+    for type_prefix, max_bytes in MAX_BYTES:
+        if type_prefix is None or content_type.startswith(type_prefix):
+            return max_bytes
+
+
+def preflight(r):
+    """
+    Why a response body isn't worth reading, judged from its headers alone, or None.
+    """
+    content_type = (r.headers.get("Content-Type") or "").lower()
+    if content_type.startswith(BINARY_TYPES):
+        return "binary content ({})".format(content_type.split(";")[0])
+    length = r.headers.get("Content-Length", "")
+    if length.isdigit() and int(length) > max_bytes_for(content_type):
+        return "too large ({} bytes)".format(length)
+    return None
+
+
+def read_capped(r, until=None, deadline=None):
+    """
+    Reads a streamed response body in chunks, stopping at the byte cap for its
+    content type, as soon as the `until` regex matches, or when the deadline runs out.
+    Sets r.truncated when the rest of the body was left unread.
+    """
+    r.skipped = preflight(r)
+    if r.skipped:
+        print("not reading {}: {}".format(r.url, r.skipped))
+        r._content = b""
+        r._content_consumed = True
+        r.truncated = True
+        r.close()
+        return r
+
+    if isinstance(until, str):
+        until = re.compile(until, re.IGNORECASE)
+    max_bytes = max_bytes_for(r.headers.get("Content-Type"))
+    body = b""
+    truncated = False
+    for chunk in r.iter_content(CHUNK_SIZE):
+        # the read timeout is per socket read, a slow trickle never trips it
+        if deadline is not None and deadline.expired:
+            print("stopped reading {} at the resolution deadline".format(r.url))
+            truncated = True
+            break
+        window_start = max(len(body) - UNTIL_OVERLAP, 0)
+        body += chunk
+        if len(body) >= max_bytes:
+            print("stopped reading {} after {} bytes".format(r.url, max_bytes))
+            body = body[:max_bytes]
+            truncated = True
+            break
+        if until is not None:
+            window = body[window_start:].decode(r.encoding or "utf-8", "replace")
+            if until.search(window):
+                truncated = True
+                break
+    r._content = body
+    r._content_consumed = True
+    r.truncated = truncated
+    if truncated:
+        # don't leave the rest of the body in a pooled connection
+        r.close()
+    return r
+
+
+def http_get(url, use_cache=True, deadline=None, until=None, **kwargs):
+    """
+    GET through the shared session and the http cache. Bodies are streamed and capped,
+    and with `until` (a regex) reading stops at its first match.
+    Cut-short bodies are never cached.
+    """
+    headers = kwargs.get("headers")
+    entry = None
+    if use_cache:
+        entry = http_cache.lookup(url, headers)
+        if entry is not None and entry.fresh:
+            return entry.to_response()
+        failure = http_cache.get_failure(url, headers)
+        if failure is not None:
+            return failure.replay()
+        if entry is not None and entry.has_validators:
+            # a 304 costs no body, and doesn't count against the GitHub rate limit
+            http_cache.stats["revalidations"] += 1
+            kwargs["headers"] = dict(headers or {}, **entry.conditional_headers())
+
+    kwargs["stream"] = True
+    with host_slot(url, deadline):
+        # after the wait for a slot, which may have used up most of the deadline
+        apply_deadline(kwargs, deadline)
+        try:
+            r = get_session().get(url, **kwargs)
+        except requests.exceptions.ConnectionError as e:
+            # timeouts often come from our own deadline, only remember hard failures
+            if use_cache and not isinstance(e, requests.exceptions.Timeout):
+                http_cache.store_failure(url, headers, error=e)
+            raise
+        read_capped(r, until, deadline)
+    if use_cache:
+        if r.status_code == 304 and entry is not None:
+            return http_cache.refresh(url, headers, entry, r)
+        if not r.truncated:
+            http_cache.store(url, headers, r)
+    return r
+
+
+def http_post(url, deadline=None, **kwargs):
+    # never cached
+    with host_slot(url, deadline):
+        apply_deadline(kwargs, deadline)
+        return get_session().post(url, **kwargs)
+
+
+class Page(object):
+    def __init__(
+        self,
+        url,
+        text,
+        status_code=None,
+        headers=None,
+        hops=None,
+        truncated=False,
+        skipped=None,
+    ):
+        self.url = url
+        self.text = text
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.hops = hops or [url]
+        # the body stopped at the byte cap or an `until` match
+        self.truncated = truncated
+        # why the body wasn't downloaded at all, e.g. a pdf behind an innocent url
+        self.skipped = skipped
+
+    def __repr__(self):
+        return "<Page {} {}>".format(self.status_code, self.url)
+
+
+def fetch_page(url, **kwargs):
+    """
+    Follows http redirects and meta refresh tags, downloading each hop once.
+    Returns the last response as a Page, with hops listing every url visited in order.
+    """
+    hops = []
+    r = None
+    while url and len(hops) < MAX_HOPS:
+        if url in hops:
+            # meta refresh loop, the body we already have is as good as it gets
+            break
+        hops.append(url)
+        r = http_get(url, **kwargs)
+        if r.url != url:
+            hops.append(r.url)
+        match = meta_refresh_re.search(r.text)
+        if match:
+            url = urllib.parse.urljoin(r.url, match.groups()[0].strip())
+        else:
+            url = None
+
+    if r is None:
+        return None
+    return Page(r.url, r.text, r.status_code, r.headers, hops, r.truncated, r.skipped)
@@ -1,21 +1,48 @@
 import base64
-import os
 import re
 
-import requests
-
 from steps.citation import CitationFileStep
 from steps.codemeta import CodemetaResponseStep
 from steps.core import MetadataStep, Step
 from steps.crossref import CrossrefResponseStep
 from steps.description import DescriptionFileStep
+from steps.github_snapshot import GithubRepoSnapshot, parse_repo
+from steps.github_tokens import github_api_get, github_graphql
 from steps.utils import (
     author_name_as_dict,
     find_or_empty_string,
-    get_webpage_text,
     strip_new_lines,
 )
 
+REPO_QUERY = """
+query($owner: String!, $name: String!) {
+  repository(owner: $owner, name: $name) {
+    name
+    url
+    createdAt
+    owner {
+      login
+      ... on User { name }
+      ... on Organization { name }
+    }
+  }
+}
+"""
+
+
+def snapshot_file(step, kind):
+    """
+    (text, raw url) of the repo's file of this kind, (None, None) when the repo has none,
+    or None when there's no snapshot and the step has to scrape the repo page instead.
+    """
+    snapshot = step.parent.get_snapshot()
+    if snapshot is None:
+        return None
+    path = snapshot.find(kind)
+    if path is None:
+        return None, None
+    return snapshot.text(path), snapshot.raw_url(path)
+
 
 class GithubRepoStep(Step):
     step_links = [("GitHub home page", "http://github.com/")]
@@ -23,6 +50,7 @@ class GithubRepoStep(Step):
         "GitHub is a Web-based software version control repository hosting service."
     )
     step_more = "Attribution information is often included in software source code, which can be inspected for software projects that have posted their code on GitHub."
+    prefetch_children = True
 
     @property
     def starting_children(self):
@@ -52,17 +80,34 @@ class GithubRepoStep(Step):
         if self.is_organization(url):
             pinned_url = self.get_pinned_url(url)
             if pinned_url:
-                self.content = get_webpage_text(pinned_url)
+                self.content = self.get_webpage_text(pinned_url)
                 self.content_url = pinned_url
                 return
 
-        self.content = get_webpage_text(url)
+        self.content = self.get_webpage_text(url)
         self.content_url = url
 
     def set_content_url(self, input):
         # set in set_content
         pass
 
+    def get_snapshot(self):
+        """
+        Snapshot of the repo behind this page, shared by the file steps below it.
+        """
+        repo = parse_repo(self.content_url)
+        if not repo:
+            return None
+
+        def load():
+            return GithubRepoSnapshot.load(
+                repo[0], repo[1], fetch=self.get_webpage, deadline=self.deadline
+            )
+
+        if self.page_store is None:
+            return load()
+        return self.page_store.memoize(("github snapshot",) + repo, load)
+
     @staticmethod
     def is_organization(url):
         url = url.replace("http://", "")
@@ -70,7 +115,7 @@ class GithubRepoStep(Step):
         return len(url.split("/")) == 2
 
     def get_pinned_url(self, url):
-        text = get_webpage_text(url)
+        text = self.get_webpage_text(url) or ""
         pinned_area = find_or_empty_string("PINNED_REPO.*\s*<span", text)
         pinned_url = find_or_empty_string('href="(\/\w+\/\w+)"', pinned_area)
         if pinned_url:
@@ -98,11 +143,22 @@ class GithubApiResponseStep(Step):
             return
 
         self.content = {}
-        h = {"User-Agent": "CiteAs"}
-        (login, token) = self.get_github_token_tuple()
         repo_api_url = self.get_repo_api_url(github_url)
 
-        r_repo = requests.get(repo_api_url, auth=(login, token), headers=h)
+        graphql_content = self.get_graphql_content(repo_api_url)
+        if graphql_content:
+            self.content = graphql_content
+            self.content_url = repo_api_url
+            self.additional_content_url = {
+                "url": "https://api.github.com/users/{}".format(
+                    graphql_content["user"]["login"]
+                ),
+                "description": "author source",
+            }
+            return
+
+        # gists, or no token for GraphQL: two REST calls
+        r_repo = github_api_get(repo_api_url, deadline=self.deadline)
         r_repo = r_repo.json()
 
         try:
@@ -113,7 +169,7 @@ class GithubApiResponseStep(Step):
             print("bad github request")
             return
 
-        r_login = requests.get(user_api_url, auth=(login, token), headers=h)
+        r_login = github_api_get(user_api_url, deadline=self.deadline)
         self.content["repo"] = r_repo
         self.content["user"] = r_login.json()
         self.content_url = repo_api_url
@@ -122,6 +178,35 @@ class GithubApiResponseStep(Step):
             "description": "author source",
         }
 
+    def get_graphql_content(self, repo_api_url):
+        """
+        Repo and owner fields used by GithubApiResponseMetadataStep in one round trip,
+        shaped like the REST responses.
+        """
+        if "api.github.com/repos/" not in repo_api_url:
+            return None
+        path_parts = repo_api_url.split("/repos/", 1)[1].split("/")
+        if len(path_parts) < 2:
+            return None
+        variables = {"owner": path_parts[0], "name": path_parts[1]}
+
+        data = github_graphql(REPO_QUERY, variables, deadline=self.deadline)
+        repo = (data or {}).get("repository")
+        if not repo:
+            return None
+        return {
+            "repo": {
+                "name": repo["name"],
+                "html_url": repo["url"],
+                "created_at": repo["createdAt"],
+                "owner": {"login": repo["owner"]["login"]},
+            },
+            "user": {
+                "login": repo["owner"]["login"],
+                "name": repo["owner"].get("name"),
+            },
+        }
+
     @staticmethod
     def get_repo_api_url(github_url):
         # remove /wiki
@@ -142,13 +227,6 @@ class GithubApiResponseStep(Step):
             repo_api_url = repo_api_url.replace("github.com/", "api.github.com/repos/")
         return repo_api_url
 
-    @staticmethod
-    def get_github_token_tuple():
-        tokens_str = os.environ["GITHUB_TOKENS"]
-        tokens = [t.split(":") for t in tokens_str.split(",")]
-        (login, token) = tokens[0]
-        return login, token
-
 
 class GithubCodemetaFileStep(Step):
     step_links = [("CodeMeta user guide", "https://codemeta.github.io/user-guide/")]
@@ -160,6 +238,11 @@ class GithubCodemetaFileStep(Step):
         return [CrossrefResponseStep, CodemetaResponseStep]
 
     def set_content(self, github_main_page_text):
+        found = snapshot_file(self, "codemeta")
+        if found is not None:
+            self.content, self.content_url = found
+            return
+
         matches = re.findall(
             'href="(.*blob/.*/codemeta.json)"', github_main_page_text, re.IGNORECASE
         )
@@ -167,7 +250,7 @@ class GithubCodemetaFileStep(Step):
             filename_part = matches[0]
             filename_part = filename_part.replace("/blob", "")
             filename = "https://raw.githubusercontent.com{}".format(filename_part)
-            self.content = get_webpage_text(filename)
+            self.content = self.get_webpage_text(filename)
             self.content_url = filename
 
     def set_content_url(self, input):
@@ -187,6 +270,13 @@ class GithubReadmeFileStep(Step):
         return [CrossrefResponseStep]
 
     def set_content(self, github_main_page_text):
+        found = snapshot_file(self, "readme")
+        if found is not None:
+            readme_text, self.content_url = found
+            if readme_text:
+                self.content = self.strip_dependencies(readme_text)
+            return
+
         matches = re.findall(
             'href="(.*blob/.*/readme.*?)"', github_main_page_text, re.IGNORECASE
         )
@@ -195,8 +285,9 @@ class GithubReadmeFileStep(Step):
             filename_part = filename_part.replace("/blob", "")
             filename_part = filename_part.replace("https://github.com", "")
             filename = "https://raw.githubusercontent.com{}".format(filename_part)
-            readme_text = get_webpage_text(filename)
-            self.content = self.strip_dependencies(readme_text)
+            readme_text = self.get_webpage_text(filename)
+            if readme_text:
+                self.content = self.strip_dependencies(readme_text)
             self.content_url = filename
 
     def set_content_url(self, input):
@@ -224,6 +315,12 @@ class GithubCitationFileStep(CitationFileStep):
     )
 
     def set_content(self, github_main_page_text):
+        # the snapshot already covers inst/CITATION and resolves symlinks
+        found = snapshot_file(self, "citation")
+        if found is not None:
+            self.content, self.content_url = found
+            return
+
         matches = re.findall(
             'href="(.*blob/.*/citation.*?)"', github_main_page_text, re.IGNORECASE
         )
@@ -233,8 +330,7 @@ class GithubCitationFileStep(CitationFileStep):
             )
             if matches:
                 inst_url = "http://github.com{}".format(matches[0])
-                r = requests.get(inst_url)
-                inst_page_text = r.text
+                inst_page_text = self.get_webpage_text(inst_url) or ""
                 matches = re.findall(
                     'href="(.*blob/.*/citation.*?)"', inst_page_text, re.IGNORECASE
                 )
@@ -247,21 +343,21 @@ class GithubCitationFileStep(CitationFileStep):
             filename = "https://raw.githubusercontent.com{}".format(filename_part)
 
             # check if symlink
-            decoded_content = self.get_symlink_content(matches)
+            decoded_content = self.get_symlink_content(matches, self.deadline)
 
             if decoded_content:
                 self.content = decoded_content
             else:
-                self.content = get_webpage_text(filename)
+                self.content = self.get_webpage_text(filename)
             self.content_url = filename
 
     @staticmethod
-    def get_symlink_content(matches):
+    def get_symlink_content(matches, deadline=None):
         repo_path = matches[0].replace("/blob/master/CITATION", "")
         api_url = "https://api.github.com/repos{}/contents/CITATION?ref=master".format(
             repo_path
         )
-        r = requests.get(api_url)
+        r = github_api_get(api_url, deadline=deadline)
         if r.status_code != 200:
             return None
         api_resp = r.json()
@@ -272,6 +368,11 @@ class GithubCitationFileStep(CitationFileStep):
 
 class GithubDescriptionFileStep(DescriptionFileStep):
     def set_content(self, github_main_page_text):
+        found = snapshot_file(self, "description")
+        if found is not None:
+            self.content, self.content_url = found
+            return
+
         matches = re.findall(
             'href="(.*blob/.*/description.*?)"', github_main_page_text, re.IGNORECASE
         )
@@ -279,7 +380,7 @@ class GithubDescriptionFileStep(DescriptionFileStep):
             filename_part = matches[0]
             filename_part = filename_part.replace("/blob", "")
             filename = "https://raw.githubusercontent.com{}".format(filename_part)
-            self.content = get_webpage_text(filename)
+            self.content = self.get_webpage_text(filename)
             self.content_url = filename
 
 
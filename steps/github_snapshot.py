@@ -0,0 +1,166 @@
+import posixpath
+import re
+
+import requests
+
+from steps.fetch import get_executor
+from steps.github_tokens import github_api_get
+from steps.utils import get_webpage
+
+TREE_URL = "https://api.github.com/repos/{}/{}/git/trees/HEAD?recursive=1"
+# one directory level, for repos too big for a recursive listing
+LEVEL_URL = "https://api.github.com/repos/{}/{}/git/trees/{}"
+RAW_URL = "https://raw.githubusercontent.com/{}/{}/HEAD/{}"
+
+# lowercased paths each file step looks for, in order of preference
+CANDIDATES = {
+    "codemeta": ["codemeta.json"],
+    "citation": ["citation", "citation.cff", "inst/citation"],
+    "description": ["description"],
+}
+SYMLINK_MODE = "120000"
+
+repo_re = re.compile(r"github\.com/([^/\s\"'#?]+)/([^/\s\"'#?]+)")
+
+
+def parse_repo(url):
+    match = repo_re.search(url or "")
+    if not match:
+        return None
+    owner, repo = match.groups()
+    if repo.endswith(".git"):
+        repo = repo[:-4]
+    return owner, repo
+
+
+class GithubRepoSnapshot(object):
+    """
+    One listing of a repo's git tree, plus the bodies of the files the Github*FileSteps
+    read, fetched together. Paths are matched case-insensitively, like GitHub shows them.
+    """
+
+    def __init__(self, owner, repo, tree):
+        self.owner = owner
+        self.repo = repo
+        # lowercased path -> git tree entry
+        self.files = {
+            item["path"].lower(): item for item in tree if item.get("type") == "blob"
+        }
+        self.bodies = {}
+
+    @classmethod
+    def load(cls, owner, repo, fetch=None, deadline=None):
+        """
+        Returns the snapshot, or None when the tree can't be listed, in which case
+        the file steps go back to scraping the repo page.
+        """
+        try:
+            r = github_api_get(TREE_URL.format(owner, repo), deadline=deadline)
+        except requests.exceptions.RequestException as e:
+            print("github tree listing failed: {}".format(e))
+            return None
+        if r.status_code != 200:
+            return None
+        try:
+            listing = r.json()
+        except ValueError:
+            print("github tree listing isn't json")
+            return None
+        tree = listing.get("tree", [])
+        if listing.get("truncated"):
+            # GitHub stops big recursive listings part way, and every candidate
+            # lives at the top level or in inst/
+            tree = cls.list_candidate_dirs(owner, repo, deadline)
+            if tree is None:
+                return None
+        snapshot = cls(owner, repo, tree)
+        snapshot.fetch_bodies(fetch or (lambda url: get_webpage(url, deadline)))
+        return snapshot
+
+    @staticmethod
+    def list_candidate_dirs(owner, repo, deadline=None):
+        """
+        Tree entries for the top level and inst/, listed one level at a time,
+        or None if the top level can't be listed.
+        """
+
+        def list_level(sha):
+            try:
+                r = github_api_get(
+                    LEVEL_URL.format(owner, repo, sha), deadline=deadline
+                )
+            except requests.exceptions.RequestException as e:
+                print("github tree listing failed: {}".format(e))
+                return None
+            if r.status_code != 200:
+                return None
+            try:
+                return r.json().get("tree", [])
+            except ValueError:
+                print("github tree listing isn't json")
+                return None
+
+        tree = list_level("HEAD")
+        if tree is None:
+            return None
+        for item in list(tree):
+            if item.get("type") == "tree" and item["path"].lower() == "inst":
+                for sub_item in list_level(item["sha"]) or []:
+                    tree.append(
+                        dict(sub_item, path=item["path"] + "/" + sub_item["path"])
+                    )
+        return tree
+
+    def find(self, kind):
+        """
+        The real path of the best candidate file of this kind, or None.
+        """
+        if kind == "readme":
+            readmes = sorted(
+                p for p in self.files if "/" not in p and p.startswith("readme")
+            )
+            paths = readmes[:1]
+        else:
+            paths = [p for p in CANDIDATES[kind] if p in self.files]
+        if not paths:
+            return None
+        return self.files[paths[0]]["path"]
+
+    def raw_url(self, path):
+        return RAW_URL.format(self.owner, self.repo, path)
+
+    def text(self, path):
+        return self.bodies.get(path)
+
+    def fetch_bodies(self, fetch):
+        paths = [self.find(kind) for kind in list(CANDIDATES) + ["readme"]]
+        paths = [p for p in paths if p]
+        if not paths:
+            return
+        # the rest go to the shared pool, while this thread fetches the first
+        futures = [
+            (p, get_executor().submit(self.fetch_body, p, fetch)) for p in paths[1:]
+        ]
+        self.bodies[paths[0]] = self.fetch_body(paths[0], fetch)
+        for path, future in futures:
+            if future.cancel():
+                # the pool is busy, perhaps with the step that's waiting here
+                self.bodies[path] = self.fetch_body(path, fetch)
+            else:
+                self.bodies[path] = future.result()
+
+    def fetch_body(self, path, fetch):
+        page = fetch(self.raw_url(path))
+        if page is None or page.status_code != 200:
+            return None
+        if self.files[path.lower()].get("mode") == SYMLINK_MODE:
+            # the blob of a symlink is its target path, relative to the link
+            target = posixpath.normpath(
+                posixpath.join(posixpath.dirname(path), page.text.strip())
+            )
+            if target.lower() not in self.files:
+                return None
+            page = fetch(self.raw_url(self.files[target.lower()]["path"]))
+            if page is None or page.status_code != 200:
+                return None
+        return page.text
@@ -0,0 +1,210 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+import requests
+
+from steps import http_cache
+from steps.fetch import http_get, http_post
+
+GRAPHQL_URL = os.environ.get("GITHUB_GRAPHQL_URL", "https://api.github.com/graphql")
+# GraphQL has no ETags to revalidate with, so answers are simply kept this long
+GRAPHQL_TTL = int(os.environ.get("CITEAS_GITHUB_GRAPHQL_TTL", 60 * 60))
+
+# what GitHub grants an authenticated token per hour, assumed until it tells us otherwise
+DEFAULT_LIMIT = 5000
+
+
+class GithubRateLimited(requests.exceptions.RequestException):
+    pass
+
+
+class RateLimit(object):
+    def __init__(self):
+        self.limit = DEFAULT_LIMIT
+        self.remaining = DEFAULT_LIMIT
+        self.reset_at = 0
+
+    @property
+    def parked(self):
+        # out of quota until GitHub's reset time
+        return self.remaining <= 0 and self.reset_at > time.time()
+
+    def to_dict(self):
+        return {
+            "limit": self.limit,
+            "remaining": self.remaining,
+            "reset_at": self.reset_at,
+            "parked": self.parked,
+        }
+
+
+class GithubToken(object):
+    def __init__(self, login, token):
+        self.login = login
+        self.token = token
+        # REST calls count against "core", GraphQL has a quota of its own
+        self.rate_limits = {"core": RateLimit(), "graphql": RateLimit()}
+        self.requests = 0
+
+    def rate_limit(self, resource="core"):
+        return self.rate_limits.setdefault(resource, RateLimit())
+
+    def to_dict(self):
+        return {
+            "login": self.login,
+            "requests": self.requests,
+            "rate_limits": {
+                resource: rate_limit.to_dict()
+                for resource, rate_limit in self.rate_limits.items()
+            },
+        }
+
+
+class GithubTokenPool(object):
+    """
+    Spreads GitHub API calls over every token in GITHUB_TOKENS ("login:token,login:token"),
+    always using the one with the most quota left according to the X-RateLimit headers.
+    Tokens out of quota sit out until GitHub resets it.
+    """
+
+    def __init__(self, tokens_str):
+        self.tokens = []
+        for token_str in (tokens_str or "").split(","):
+            if ":" in token_str:
+                (login, token) = token_str.strip().split(":", 1)
+                self.tokens.append(GithubToken(login, token))
+        self.lock = threading.Lock()
+
+    def choose(self, resource="core"):
+        """
+        The token with the most quota left for resource, or None when there are
+        no tokens or they're all out of quota.
+        """
+        with self.lock:
+            available = [t for t in self.tokens if not t.rate_limit(resource).parked]
+            if not available:
+                return None
+            token = max(available, key=lambda t: t.rate_limit(resource).remaining)
+            token.requests += 1
+            return token
+
+    def next_reset(self, resource="core"):
+        with self.lock:
+            return min(t.rate_limit(resource).reset_at for t in self.tokens)
+
+    def update(self, token, headers):
+        remaining = headers.get("X-RateLimit-Remaining")
+        if remaining is None:
+            return
+        with self.lock:
+            rate_limit = token.rate_limit(headers.get("X-RateLimit-Resource", "core"))
+            rate_limit.remaining = int(remaining)
+            rate_limit.limit = int(headers.get("X-RateLimit-Limit", rate_limit.limit))
+            rate_limit.reset_at = int(
+                headers.get("X-RateLimit-Reset", rate_limit.reset_at)
+            )
+
+    def to_dict(self):
+        return [t.to_dict() for t in self.tokens]
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_token_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = GithubTokenPool(os.environ.get("GITHUB_TOKENS"))
+    return _pool
+
+
+def is_rate_limited(r):
+    return r.status_code in (403, 429) and r.headers.get("X-RateLimit-Remaining") == "0"
+
+
+def github_api_get(url, **kwargs):
+    """
+    GET against api.github.com with the best token in the pool, moving on to
+    the next token when one turns out to be rate limited. Raises GithubRateLimited
+    without sending anything when every token is out of quota.
+    """
+    pool = get_token_pool()
+    r = None
+    for attempt in range(max(len(pool.tokens), 1)):
+        token = pool.choose()
+        if token is None and pool.tokens:
+            if r is not None:
+                # the last token just ran out
+                break
+            raise GithubRateLimited(
+                "every github token is out of quota until {}".format(pool.next_reset())
+            )
+        auth = (token.login, token.token) if token else None
+        r = http_get(url, auth=auth, **kwargs)
+        # a response straight from our cache says nothing about current quota
+        if token and (not getattr(r, "from_cache", False) or r.revalidated):
+            pool.update(token, r.headers)
+        if not is_rate_limited(r):
+            break
+    return r
+
+
+def graphql_cache_url(query, variables):
+    # POSTs have no url of their own to cache under, so make one from the body
+    body = json.dumps({"query": query, "variables": variables}, sort_keys=True)
+    return "{}#{}".format(GRAPHQL_URL, hashlib.sha1(body.encode("utf-8")).hexdigest())
+
+
+def github_graphql(query, variables, deadline=None):
+    """
+    Runs a GraphQL query with the best token in the pool and returns its "data",
+    or None when there's no token to run it with or the query failed.
+    Answers are cached for GRAPHQL_TTL.
+    """
+    cache_url = graphql_cache_url(query, variables)
+    entry = http_cache.lookup(cache_url)
+    if entry is not None and entry.fresh:
+        return json.loads(entry.body)
+
+    pool = get_token_pool()
+    token = pool.choose("graphql")
+    if token is None:
+        # unlike REST, GraphQL refuses anonymous requests. Out of GraphQL quota,
+        # the caller falls back to REST
+        return None
+    try:
+        r = http_post(
+            GRAPHQL_URL,
+            json={"query": query, "variables": variables},
+            headers={"Authorization": "bearer {}".format(token.token)},
+            deadline=deadline,
+        )
+    except requests.exceptions.RequestException as e:
+        print("github graphql request failed: {}".format(e))
+        return None
+    pool.update(token, r.headers)
+    if r.status_code != 200:
+        print("github graphql request failed with status {}".format(r.status_code))
+        return None
+    try:
+        response = r.json()
+    except ValueError:
+        print("github graphql answered with something that isn't json")
+        return None
+    if response.get("errors"):
+        print("github graphql errors: {}".format(response["errors"]))
+    elif response.get("data") is not None:
+        http_cache.seed(
+            cache_url,
+            None,
+            json.dumps(response["data"]).encode("utf-8"),
+            "application/json",
+            ttl=GRAPHQL_TTL,
+        )
+    return response.get("data")
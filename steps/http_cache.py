@@ -0,0 +1,509 @@
+from collections import OrderedDict
+import json
+import os
+import sqlite3
+import threading
+import time
+import urllib.parse
+import zlib
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+HOUR = 60 * 60
+DAY = 24 * HOUR
+
+CACHE_ENABLED = os.environ.get("CITEAS_HTTP_CACHE", "1") != "0"
+CACHE_PATH = os.environ.get("CITEAS_CACHE_PATH", "citeas_http_cache.sqlite")
+L1_SIZE = int(os.environ.get("CITEAS_CACHE_L1_SIZE", 512))
+# total body bytes kept in process. Bodies over L1_MAX_BODY are only kept in sqlite
+L1_MAX_BYTES = int(os.environ.get("CITEAS_CACHE_L1_BYTES", 64 * 1024 * 1024))
+L1_MAX_BODY = 1024 * 1024
+# bodies bigger than this aren't cached at all
+MAX_BODY = int(os.environ.get("CITEAS_CACHE_MAX_BODY", 8 * 1024 * 1024))
+
+# stale rows that still have validators are kept this long so they can be revalidated
+STALE_RETENTION = 30 * DAY
+
+# (host suffix, content type prefix, seconds fresh), first match wins.
+# None matches anything, a ttl of 0 means always revalidate with the stored ETag.
+# Once stale, entries with an ETag or Last-Modified are revalidated instead of refetched.
+TTL_POLICIES = [
+    ("doi.org", "application/vnd.citationstyles.csl+json", 21 * DAY),
+    ("doi.org", "application/json", 21 * DAY),
+    ("api.github.com", None, 0),
+    ("github.com", "text/html", 6 * HOUR),
+    ("raw.githubusercontent.com", None, 6 * HOUR),
+    ("cran.r-project.org", None, DAY),
+    ("pypi.org", None, DAY),
+    (None, None, DAY),
+]
+
+# known-missing resources and failing hosts are remembered briefly, keyed by status class
+NEGATIVE_TTLS = {"4xx": HOUR, "5xx": 5 * 60, "error": 5 * 60}
+NEGATIVE_STATUSES = (404, 406, 410)
+# error pages are only kept so a replay looks exactly like the original response
+NEGATIVE_MAX_BODY = 64 * 1024
+
+stats = {
+    "l1_hits": 0,
+    "l2_hits": 0,
+    "misses": 0,
+    "stores": 0,
+    "negative_lookups": 0,
+    "negative_hits": 0,
+    "negative_stores": 0,
+    "revalidations": 0,
+    "not_modified": 0,
+}
+
+_l1 = OrderedDict()
+_l1_bytes = 0
+_failures = OrderedDict()
+_l1_lock = threading.Lock()
+_local = threading.local()
+
+
+class CacheEntry(object):
+    def __init__(
+        self, url, status, headers, body, etag, last_modified, stored_at, expires_at
+    ):
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.stored_at = stored_at
+        self.expires_at = expires_at
+
+    @property
+    def fresh(self):
+        return time.time() < self.expires_at
+
+    @property
+    def has_validators(self):
+        return bool(self.etag or self.last_modified)
+
+    def conditional_headers(self):
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+    def to_response(self):
+        r = requests.Response()
+        r.status_code = self.status
+        r.reason = "OK"
+        r.url = self.url
+        r.headers = CaseInsensitiveDict(self.headers)
+        r.encoding = requests.utils.get_encoding_from_headers(r.headers)
+        r._content = self.body
+        r.from_cache = True
+        r.revalidated = False
+        r.truncated = False
+        r.skipped = None
+        return r
+
+
+class FailureEntry(object):
+    def __init__(self, url, status_class, status, headers, body, expires_at):
+        self.url = url
+        self.status_class = status_class
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.expires_at = expires_at
+
+    @property
+    def fresh(self):
+        return time.time() < self.expires_at
+
+    def replay(self):
+        if self.status_class == "error":
+            raise requests.exceptions.ConnectionError(
+                "{} failed recently, not retrying yet".format(self.url)
+            )
+        r = CacheEntry(
+            self.url, self.status, self.headers, self.body, None, None, 0, 0
+        ).to_response()
+        r.reason = None
+        return r
+
+
+def status_class(status):
+    if status in NEGATIVE_STATUSES:
+        return "4xx"
+    if status >= 500:
+        return "5xx"
+    return None
+
+
+def ttl_for(url, content_type):
+    host = (urllib.parse.urlparse(url).hostname or "").lower()
+    content_type = (content_type or "").lower()
+    for host_suffix, type_prefix, ttl in TTL_POLICIES:
+        if host_suffix and not (
+            host == host_suffix or host.endswith("." + host_suffix)
+        ):
+            continue
+        if type_prefix and not content_type.startswith(type_prefix):
+            continue
+        return ttl
+    return DAY
+
+
+def cache_key(url, headers=None):
+    # the same url can answer with html or csl-json depending on Accept
+    accept = ""
+    if headers:
+        accept = CaseInsensitiveDict(headers).get("Accept", "")
+    return "GET {} {}".format(url, accept)
+
+
+def get_db():
+    pid = os.getpid()
+    if getattr(_local, "pid", None) != pid:
+        db = sqlite3.connect(CACHE_PATH, timeout=10)
+        # WAL lets every gunicorn worker read while one writes
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                url TEXT,
+                status INTEGER,
+                headers TEXT,
+                body BLOB,
+                etag TEXT,
+                last_modified TEXT,
+                stored_at REAL,
+                expires_at REAL
+            )"""
+        )
+        db.execute(
+            """CREATE TABLE IF NOT EXISTS failures (
+                key TEXT PRIMARY KEY,
+                url TEXT,
+                status_class TEXT,
+                status INTEGER,
+                headers TEXT,
+                body BLOB,
+                expires_at REAL
+            )"""
+        )
+        db.execute(
+            "DELETE FROM responses WHERE expires_at < ?",
+            (time.time() - STALE_RETENTION,),
+        )
+        db.execute("DELETE FROM failures WHERE expires_at < ?", (time.time(),))
+        db.commit()
+        _local.db = db
+        _local.pid = pid
+    return _local.db
+
+
+def l1_get(key):
+    with _l1_lock:
+        entry = _l1.get(key)
+        if entry is not None:
+            _l1.move_to_end(key)
+        return entry
+
+
+def l1_put(key, entry):
+    global _l1_bytes
+    with _l1_lock:
+        old = _l1.pop(key, None)
+        if old is not None:
+            _l1_bytes -= len(old.body)
+        if len(entry.body) > L1_MAX_BODY:
+            return
+        _l1[key] = entry
+        _l1_bytes += len(entry.body)
+        while len(_l1) > L1_SIZE or _l1_bytes > L1_MAX_BYTES:
+            _, evicted = _l1.popitem(last=False)
+            _l1_bytes -= len(evicted.body)
+
+
+def clear_l1():
+    global _l1_bytes
+    with _l1_lock:
+        _l1.clear()
+        _l1_bytes = 0
+
+
+def l2_get(key):
+    try:
+        row = (
+            get_db()
+            .execute(
+                "SELECT url, status, headers, body, etag, last_modified, stored_at, expires_at "
+                "FROM responses WHERE key = ?",
+                (key,),
+            )
+            .fetchone()
+        )
+    except sqlite3.Error as e:
+        print("http cache read failed: {}".format(e))
+        return None
+    if row is None:
+        return None
+    url, status, headers, body, etag, last_modified, stored_at, expires_at = row
+    return CacheEntry(
+        url,
+        status,
+        json.loads(headers),
+        zlib.decompress(body),
+        etag,
+        last_modified,
+        stored_at,
+        expires_at,
+    )
+
+
+def l2_put(key, entry):
+    try:
+        db = get_db()
+        db.execute(
+            "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                key,
+                entry.url,
+                entry.status,
+                json.dumps(entry.headers),
+                zlib.compress(entry.body),
+                entry.etag,
+                entry.last_modified,
+                entry.stored_at,
+                entry.expires_at,
+            ),
+        )
+        db.commit()
+    except sqlite3.Error as e:
+        print("http cache write failed: {}".format(e))
+
+
+def lookup(url, headers=None):
+    """
+    Returns the CacheEntry for this request, fresh or stale, or None.
+    """
+    if not CACHE_ENABLED:
+        return None
+    key = cache_key(url, headers)
+    entry = l1_get(key)
+    if entry is not None:
+        if entry.fresh:
+            stats["l1_hits"] += 1
+        return entry
+    entry = l2_get(key)
+    if entry is not None:
+        l1_put(key, entry)
+        if entry.fresh:
+            stats["l2_hits"] += 1
+    if entry is None or not entry.fresh:
+        stats["misses"] += 1
+    return entry
+
+
+def get(url, headers=None):
+    """
+    Returns a fresh cached response, or None.
+    """
+    entry = lookup(url, headers)
+    if entry is not None and entry.fresh:
+        return entry.to_response()
+    return None
+
+
+def refresh(url, headers, entry, r):
+    """
+    Upstream answered 304 Not Modified to a conditional request:
+    the stored body is good for another ttl, served in place of the empty 304.
+    """
+    stats["not_modified"] += 1
+    for header in (
+        "ETag",
+        "Last-Modified",
+        "Cache-Control",
+        "Expires",
+        "Date",
+        "X-RateLimit-Limit",
+        "X-RateLimit-Remaining",
+        "X-RateLimit-Reset",
+    ):
+        if header in r.headers:
+            entry.headers[header] = r.headers[header]
+    entry.etag = r.headers.get("ETag", entry.etag)
+    entry.last_modified = r.headers.get("Last-Modified", entry.last_modified)
+    entry.stored_at = time.time()
+    entry.expires_at = entry.stored_at + ttl_for(
+        url, CaseInsensitiveDict(entry.headers).get("Content-Type")
+    )
+    key = cache_key(url, headers)
+    l1_put(key, entry)
+    l2_put(key, entry)
+    r = entry.to_response()
+    r.revalidated = True
+    return r
+
+
+def store(url, headers, r):
+    if not CACHE_ENABLED:
+        return
+    if status_class(r.status_code):
+        store_failure(url, headers, r=r)
+        return
+    if r.status_code != 200 or len(r.content) > MAX_BODY:
+        return
+    now = time.time()
+    ttl = ttl_for(url, r.headers.get("Content-Type"))
+    etag = r.headers.get("ETag")
+    last_modified = r.headers.get("Last-Modified")
+    if ttl == 0 and not (etag or last_modified):
+        # nothing to revalidate with, so nothing worth keeping
+        return
+    entry = CacheEntry(
+        r.url,
+        r.status_code,
+        dict(r.headers),
+        r.content,
+        etag,
+        last_modified,
+        now,
+        now + ttl,
+    )
+    key = cache_key(url, headers)
+    l1_put(key, entry)
+    l2_put(key, entry)
+    stats["stores"] += 1
+
+
+def seed(url, headers, body, content_type, ttl=None):
+    """
+    Stores a body we got some other way, like one record of a bulk API answer,
+    as if url had been fetched with these request headers. ttl defaults to the
+    policy for url.
+    """
+    if not CACHE_ENABLED or len(body) > MAX_BODY:
+        return
+    now = time.time()
+    entry = CacheEntry(
+        url,
+        200,
+        {"Content-Type": content_type},
+        body,
+        None,
+        None,
+        now,
+        now + (ttl_for(url, content_type) if ttl is None else ttl),
+    )
+    key = cache_key(url, headers)
+    l1_put(key, entry)
+    l2_put(key, entry)
+    stats["stores"] += 1
+
+
+def get_failure(url, headers=None):
+    """
+    Returns a FailureEntry if this request failed recently, or None.
+    """
+    if not CACHE_ENABLED:
+        return None
+    stats["negative_lookups"] += 1
+    key = cache_key(url, headers)
+    with _l1_lock:
+        entry = _failures.get(key)
+    if entry is None:
+        try:
+            row = (
+                get_db()
+                .execute(
+                    "SELECT url, status_class, status, headers, body, expires_at "
+                    "FROM failures WHERE key = ?",
+                    (key,),
+                )
+                .fetchone()
+            )
+        except sqlite3.Error as e:
+            print("http cache read failed: {}".format(e))
+            row = None
+        if row is None:
+            return None
+        url, failure_class, status, stored_headers, body, expires_at = row
+        entry = FailureEntry(
+            url,
+            failure_class,
+            status,
+            json.loads(stored_headers),
+            zlib.decompress(body),
+            expires_at,
+        )
+    if not entry.fresh:
+        return None
+    stats["negative_hits"] += 1
+    return entry
+
+
+def store_failure(url, headers, r=None, error=None):
+    """
+    Remembers a 404/410-style answer (r) or a connection failure (error) for a short while.
+    """
+    if not CACHE_ENABLED:
+        return
+    if r is not None:
+        failure_class = status_class(r.status_code)
+        entry = FailureEntry(
+            r.url,
+            failure_class,
+            r.status_code,
+            dict(r.headers),
+            r.content[:NEGATIVE_MAX_BODY],
+            time.time() + NEGATIVE_TTLS[failure_class],
+        )
+    else:
+        entry = FailureEntry(
+            url, "error", 0, {}, b"", time.time() + NEGATIVE_TTLS["error"]
+        )
+
+    key = cache_key(url, headers)
+    with _l1_lock:
+        _failures[key] = entry
+        _failures.move_to_end(key)
+        while len(_failures) > L1_SIZE:
+            _failures.popitem(last=False)
+    try:
+        db = get_db()
+        db.execute(
+            "INSERT OR REPLACE INTO failures VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                key,
+                entry.url,
+                entry.status_class,
+                entry.status,
+                json.dumps(entry.headers),
+                zlib.compress(entry.body),
+                entry.expires_at,
+            ),
+        )
+        db.commit()
+    except sqlite3.Error as e:
+        print("http cache write failed: {}".format(e))
+    stats["negative_stores"] += 1
+
+
+def rate(hits, lookups):
+    return round(hits / lookups, 3) if lookups else None
+
+
+def cache_stats():
+    lookups = stats["l1_hits"] + stats["l2_hits"] + stats["misses"]
+    ret = dict(stats)
+    ret["hit_rate"] = rate(stats["l1_hits"] + stats["l2_hits"], lookups)
+    ret["negative_hit_rate"] = rate(stats["negative_hits"], stats["negative_lookups"])
+    ret["l1_entries"] = len(_l1)
+    ret["l1_bytes"] = _l1_bytes
+    ret["l1_failures"] = len(_failures)
+    return ret
@@ -0,0 +1,61 @@
+from collections import defaultdict
+import threading
+
+from steps.utils import get_webpage
+
+
+class PageStore(object):
+    """
+    Pages fetched during one resolution, keyed by url, so sibling steps
+    looking at the same repo or project page share a single download.
+    Failed fetches are remembered too, they won't succeed a few seconds later.
+    """
+
+    def __init__(self):
+        self.pages = {}
+        self.values = {}
+        self._lock = threading.Lock()
+        self._url_locks = defaultdict(threading.Lock)
+
+    def get_page(self, url, deadline=None, until=None):
+        """
+        Returns (page, hit), where hit says whether the page was already in the store.
+        With `until`, a stored page is still used, and a new download stops early.
+        It is only stored if no match was found and the whole page was read,
+        since other steps may need the rest of it. Pages cut at the byte cap are
+        stored: downloading again would stop at the same cap, so sharing them
+        only saves the repeat.
+        """
+        if until is not None:
+            with self._lock:
+                if url in self.pages:
+                    return self.pages[url], True
+            page = get_webpage(url, deadline=deadline, until=until)
+            if page is not None and not page.truncated:
+                with self._lock:
+                    self.pages.setdefault(url, page)
+            return page, False
+
+        with self._lock:
+            url_lock = self._url_locks[url]
+        # one download per url, even when steps ask for it at the same time
+        with url_lock:
+            with self._lock:
+                if url in self.pages:
+                    return self.pages[url], True
+            page = get_webpage(url, deadline=deadline)
+            with self._lock:
+                self.pages[url] = page
+            return page, False
+
+    def memoize(self, key, fn):
+        """
+        Computes fn() once per resolution for things built from several fetches,
+        like a repo snapshot, however many steps ask for it.
+        """
+        with self._lock:
+            key_lock = self._url_locks[key]
+        with key_lock:
+            if key not in self.values:
+                self.values[key] = fn()
+            return self.values[key]
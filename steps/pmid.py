@@ -5,7 +5,6 @@ from steps.bitbucket import BitbucketRepoStep
 from steps.crossref import CrossrefResponseStep
 from steps.github import GithubRepoStep
 from steps.core import MetadataStep, Step
-from steps.utils import get_webpage_text
 
 
 class PMIDStep(Step):
@@ -45,4 +44,4 @@ class PMIDStep(Step):
 
         if pubmed_url:
             self.content_url = f"https://{pubmed_url}"
-            self.content = get_webpage_text(self.content_url)
+            self.content = self.get_webpage_text(self.content_url)
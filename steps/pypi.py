@@ -3,7 +3,6 @@ from steps.bitbucket import BitbucketRepoStep
 from steps.core import Step
 from steps.crossref import CrossrefResponseStep
 from steps.github import GithubRepoStep
-from steps.utils import get_webpage_text
 
 
 class PypiLibraryStep(Step):
@@ -20,11 +19,11 @@ class PypiLibraryStep(Step):
     def set_content(self, input):
         self.set_content_url(input)
         if self.content_url:
-            page = get_webpage_text(self.content_url)
+            page = self.get_webpage_text(self.content_url)
             # get rid of the header because it has pypi specific stuff, not stuff about the library
             # makes it hard to get github links out for the library
             # see for example https://pypi.python.org/pypi/executor
-            if '<div id="content-body">' in page:
+            if page and '<div id="content-body">' in page:
                 page = page.split('<div id="content-body">')[1]
             self.content = page
 
@@ -2,7 +2,6 @@ import requests
 
 from steps.core import MetadataStep, Step
 from steps.crossref import CrossrefResponseStep
-from steps.utils import get_webpage_text
 
 
 class RelationHeaderStep(Step):
@@ -23,14 +22,16 @@ class RelationHeaderStep(Step):
                 if "doi.org" in relation_link:
                     self.content = "found"
                 else:
-                    return get_webpage_text(relation_link)
+                    return self.get_webpage_text(relation_link)
 
     def check_for_rel_cite_as_header(self, input):
-        r = requests.get(input)
+        page = self.get_webpage(input)
+        if page is None:
+            return None
 
         cite_as_links = []
-        if "link" in r.headers:
-            header_links = requests.utils.parse_header_links(r.headers["link"])
+        if "link" in page.headers:
+            header_links = requests.utils.parse_header_links(page.headers["link"])
             for link in header_links:
                 if "rel" in link and link["rel"] == "cite-as":
                     cite_as_links.append(link)
@@ -9,6 +9,7 @@ from steps.bitbucket import BitbucketRepoStep
 from steps.cran import CranLibraryStep
 from steps.core import Step
 from steps.crossref import CrossrefResponseStep
+from steps.fetch import http_get
 from steps.github import GithubRepoStep
 from steps.google import GoogleStep
 from steps.pmid import PMIDStep
@@ -17,6 +18,8 @@ from steps.webpage import WebpageStep
 
 
 class UserInputStep(Step):
+    prefetch_children = True
+
     @property
     def starting_children(self):
         return [
@@ -36,7 +39,7 @@ class UserInputStep(Step):
         if url.startswith("ftp://"):
             abort(404)
         if "readthedocs" in url:
-            url = self.get_citation_html_file(url)
+            url = self.get_citation_html_file(url, self.deadline)
         self.content_url = url
 
     def set_content(self, input):
@@ -47,7 +50,7 @@ class UserInputStep(Step):
         else:
             self.content = self.content_url
 
-    def build_starting_url(self, input):
+    def build_starting_url(self, input, probe=True):
         # doi
         if input.startswith("10."):
             url = "http://doi.org/{}".format(input)
@@ -70,7 +73,7 @@ class UserInputStep(Step):
             url = "http://arxiv.org/abs/{}".format(input)
 
         # add http to see if it is a valid URL
-        elif self.is_valid_url(input):
+        elif self.is_valid_url(input, self.deadline, probe):
             url = "http://{}".format(input)
 
         else:
@@ -86,18 +89,21 @@ class UserInputStep(Step):
             return True
 
     @staticmethod
-    def is_valid_url(input):
+    def is_valid_url(input, deadline=None, probe=True):
         url = "http://{}".format(input)
         if validators.url(url):
+            # without probing, a url that looks valid is taken at its word
+            if not probe:
+                return True
             try:
-                r = requests.get(url, timeout=1)
+                r = http_get(url, timeout=1, deadline=deadline)
                 if r.status_code == requests.codes.ok:
                     return True
             except:
                 return False
 
     @staticmethod
-    def get_citation_html_file(url):
+    def get_citation_html_file(url, deadline=None):
         # citation paths
         citation_opt_1 = "citation.html"
         citation_opt_2 = "reference/citing.html"
@@ -121,7 +127,7 @@ class UserInputStep(Step):
         # check if citation exists
         try:
             for citation_url in citation_urls:
-                r = requests.get(citation_url, timeout=2)
+                r = http_get(citation_url, timeout=2, deadline=deadline)
                 if r.status_code == 200:
                     return citation_url
             return url
@@ -1,11 +1,12 @@
 from html import escape
 import re
 import unicodedata
-import urllib.parse
 
 from nameparser import HumanName
 import requests
 
+from steps.fetch import fetch_page
+
 
 def get_subject(class_name):
     name_lower = class_name.lower()
@@ -189,38 +190,26 @@ def header(citation_part, url):
 
 
 def get_hops(url):
-    redirect_re = re.compile("<meta[^>]*?url=(.*?)[\"']", re.IGNORECASE)
-    hops = []
-    while url:
-        if url in hops:
-            url = None
-        else:
-            hops.insert(0, url)
-            headers = {
-                "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_11_5) "
-                "AppleWebKit/537.36 (KHTML, like Gecko) "
-                "Chrome/50.0.2661.102 Safari/537.36"
-            }
-            r = requests.get(url, headers=headers)
-            if r.url != url:
-                hops.insert(0, r.url)
-            # check for redirect meta tag
-            match = redirect_re.search(r.text)
-            if match:
-                url = urllib.parse.urljoin(url, match.groups()[0].strip())
-            else:
-                url = None
-    return hops
+    # most recent hop first
+    page = get_webpage(url)
+    if page is None:
+        return []
+    return list(reversed(page.hops))
 
 
-def get_webpage_text(starting_url):
-    hops = get_hops(starting_url)
+def get_webpage(starting_url, deadline=None, until=None):
     try:
-        url = hops[0]
-        r = requests.get(url)
-    except Exception:
-        return
-    return r.text
+        return fetch_page(starting_url, deadline=deadline, until=until)
+    except requests.exceptions.RequestException as e:
+        print("couldn't fetch {}: {}".format(starting_url, e))
+        return None
+
+
+def get_webpage_text(starting_url):
+    page = get_webpage(starting_url)
+    if page is None:
+        return None
+    return page.text
 
 
 def author_name_as_dict(literal_name):
@@ -9,7 +9,6 @@ from steps.relation_header import RelationHeaderStep
 from steps.utils import (
     build_source_preview,
     find_or_empty_string,
-    get_webpage_text,
     strip_new_lines,
 )
 
@@ -32,7 +31,18 @@ class WebpageStep(Step):
         ]
 
     def set_content(self, input):
-        self.content = get_webpage_text(self.content_url)
+        page = self.get_webpage(self.content_url)
+        if page is not None and page.skipped:
+            # a pdf, archive or huge file: no page to scrape, so only the checks
+            # that need nothing more than headers and the url itself
+            self.remaining_children = [
+                RelationHeaderStep,
+                CrossrefResponseStep,
+                WebpageMetadataStep,
+            ]
+            self.content = self.content_url
+            return
+        self.content = page.text if page else None
 
     def set_content_url(self, input):
         self.content_url = input
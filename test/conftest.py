@@ -0,0 +1,24 @@
+import os
+import tempfile
+
+# keep the persistent http cache out of the working tree and away from earlier runs
+os.environ.setdefault(
+    "CITEAS_CACHE_PATH", os.path.join(tempfile.mkdtemp(), "http_cache.sqlite")
+)
+os.environ.setdefault(
+    "CITEAS_JOBS_PATH", os.path.join(tempfile.mkdtemp(), "jobs.sqlite")
+)
+# no background job workers, tests work the queue themselves
+os.environ.setdefault("CITEAS_JOB_THREADS", "0")
+os.environ.setdefault(
+    "CITEAS_INFLIGHT_PATH", os.path.join(tempfile.mkdtemp(), "inflight.sqlite")
+)
+os.environ.setdefault(
+    "CITEAS_DOI_STORE_PATH", os.path.join(tempfile.mkdtemp(), "dois.sqlite")
+)
+os.environ.setdefault(
+    "CITEAS_ARXIV_SLOTS_PATH", os.path.join(tempfile.mkdtemp(), "arxiv_slots.sqlite")
+)
+os.environ.setdefault(
+    "CITEAS_CRAN_INDEX_PATH", os.path.join(tempfile.mkdtemp(), "cran.sqlite")
+)
@@ -0,0 +1,66 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+
+
+class StubServer(object):
+    """
+    Tiny local http server for tests that must not touch the network.
+    routes maps a path (with query string) to (status, headers dict, body),
+    or to a callable taking the handler and returning that tuple.
+    """
+
+    def __init__(self, routes):
+        self.routes = routes
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.handle(self)
+
+            def do_HEAD(self):
+                stub.handle(self, send_body=False)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                self.body = self.rfile.read(length)
+                stub.handle(self)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:{}".format(self.server.server_address[1])
+
+    def handle(self, handler, send_body=True):
+        self.requests.append((handler.command, handler.path, dict(handler.headers)))
+        route = self.routes.get(handler.path)
+        if route is None:
+            route = (404, {}, "not found")
+        elif callable(route):
+            route = route(handler)
+        status, headers, body = route
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        handler.send_response(status)
+        for k, v in headers.items():
+            handler.send_header(k, v)
+        handler.send_header("Content-Length", str(len(body)))
+        handler.end_headers()
+        if send_body:
+            handler.wfile.write(body)
+
+    def count(self, path):
+        return len([r for r in self.requests if r[1] == path])
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
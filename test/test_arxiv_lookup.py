@@ -0,0 +1,140 @@
+import threading
+import time
+
+import pytest
+import requests
+
+from steps import arxiv_lookup
+from steps.deadline import Deadline
+from test.stub_server import StubServer
+
+ENTRY = """<entry>
+    <id>http://arxiv.org/abs/{id}v2</id>
+    <updated>2019-01-02T00:00:00Z</updated>
+    <published>2018-02-07T00:00:00Z</published>
+    <title>Paper {id}</title>
+    <summary>About {id}.</summary>
+    <author><name>Ada Lovelace</name></author>
+    <category term="cs.DL" scheme="http://arxiv.org/schemas/atom"/>
+  </entry>"""
+
+
+def feed(*ids):
+    return '<feed xmlns="http://www.w3.org/2005/Atom">{}</feed>'.format(
+        "".join(ENTRY.format(id=id) for id in ids)
+    )
+
+
+routes = {
+    "/api/query?id_list=1802.02689,1812.02329&max_results=2": (
+        200,
+        {},
+        feed("1802.02689", "1812.02329"),
+    ),
+    "/api/query?id_list=1812.02329,1802.02689&max_results=2": (
+        200,
+        {},
+        feed("1812.02329", "1802.02689"),
+    ),
+    # arXiv's answer for an id it doesn't have is an empty entry
+    "/api/query?id_list=1801.00001&max_results=1": (
+        200,
+        {},
+        feed().replace("</feed>", "<entry><id/></entry></feed>"),
+    ),
+}
+
+
+@pytest.fixture(autouse=True)
+def own_slots(tmp_path, monkeypatch):
+    # slots booked by one test shouldn't hold up the next
+    monkeypatch.setattr(arxiv_lookup, "SLOTS_PATH", str(tmp_path / "slots.sqlite"))
+    monkeypatch.setattr(arxiv_lookup, "_local", threading.local())
+
+
+def test_concurrent_lookups_share_one_query(monkeypatch):
+    monkeypatch.setattr(arxiv_lookup, "MIN_INTERVAL", 0.5)
+    with StubServer(routes) as server:
+        monkeypatch.setattr(arxiv_lookup, "ARXIV_API_URL", server.url + "/api/query")
+        lookup = arxiv_lookup.ArxivLookup(window=5)
+
+        # alone, a lookup doesn't wait out the window
+        started = time.monotonic()
+        assert lookup.get("1801.00001") is None
+        assert time.monotonic() - started < 5
+
+        results = {}
+
+        def get(arxiv_id):
+            results[arxiv_id] = lookup.get(arxiv_id)
+
+        # the next query has to wait for its slot, and the second lookup joins it
+        threads = [
+            threading.Thread(target=get, args=(arxiv_id,))
+            for arxiv_id in ("1802.02689", "1812.02329")
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert lookup.queries == 2
+        assert len(server.requests) == 2
+        assert results["1802.02689"].title == "Paper 1802.02689"
+        assert results["1812.02329"].authors == ["Ada Lovelace"]
+
+        # cached by versioned id too, and found by a fresh lookup through the http cache
+        assert lookup.get("1802.02689v2").title == "Paper 1802.02689"
+        fresh = arxiv_lookup.ArxivLookup(window=0)
+        assert fresh.get("1812.02329").id == "1812.02329v2"
+        assert fresh.queries == 0
+        assert len(server.requests) == 2
+
+
+def test_lookups_give_up_on_a_slot_past_their_deadline(monkeypatch):
+    monkeypatch.setattr(arxiv_lookup, "MIN_INTERVAL", 30)
+    with StubServer(routes) as server:
+        monkeypatch.setattr(arxiv_lookup, "ARXIV_API_URL", server.url + "/api/query")
+        lookup = arxiv_lookup.ArxivLookup(window=0)
+        lookup.get("1801.00001")
+
+        started = time.monotonic()
+        with pytest.raises(requests.exceptions.Timeout):
+            lookup.get("1801.00002", Deadline(0.2))
+        assert time.monotonic() - started < 1
+        assert len(server.requests) == 1
+
+
+def test_batches_are_capped_and_unknown_ids_come_back_none(monkeypatch):
+    monkeypatch.setattr(arxiv_lookup, "MIN_INTERVAL", 0)
+    capped_routes = {
+        "/api/query?id_list=2001.00001,2001.00002&max_results=2": (
+            200,
+            {},
+            feed("2001.00001"),
+        ),
+        "/api/query?id_list=2001.00003&max_results=1": (200, {}, feed("2001.00003")),
+        # arXiv's answer for an id it doesn't have is an empty entry
+        "/api/query?id_list=2001.00002&max_results=1": (
+            200,
+            {},
+            feed().replace("</feed>", "<entry><id/></entry></feed>"),
+        ),
+    }
+    with StubServer(capped_routes) as server:
+        monkeypatch.setattr(arxiv_lookup, "ARXIV_API_URL", server.url + "/api/query")
+        lookup = arxiv_lookup.ArxivLookup(window=0, batch_size=2)
+        lookup.get_many(["2001.00001", "2001.00002", "2001.00003"])
+
+        assert lookup.queries == 2
+        assert lookup.get("2001.00002") is None
+        assert lookup.get("2001.00003").title == "Paper 2001.00003"
+
+
+def test_slots_are_shared_between_processes(monkeypatch):
+    monkeypatch.setattr(arxiv_lookup, "MIN_INTERVAL", 3)
+    # separate lookups stand in for the lookups of separate worker processes
+    first = arxiv_lookup.ArxivLookup()
+    second = arxiv_lookup.ArxivLookup()
+    assert first.reserve() <= 0
+    assert second.reserve() > 2.5
@@ -0,0 +1,38 @@
+import json
+
+from test.stub_server import StubServer
+import views
+from views import app
+
+routes = {
+    "/one": (200, {}, "<html><title>Project one</title></html>"),
+    "/two": (200, {}, "<html><title>Project two</title></html>"),
+}
+
+
+def test_batch_streams_one_line_per_input():
+    with StubServer(routes) as server:
+        ids = [server.url + "/one", server.url + "/two", server.url + "/one/"]
+        client = app.test_client()
+        r = client.post("/products", json={"ids": ids})
+        assert r.mimetype == "application/x-ndjson"
+        lines = [json.loads(line) for line in r.data.decode("utf-8").splitlines()]
+
+        assert sorted(line["index"] for line in lines) == [0, 1, 2]
+        names = {line["index"]: line["result"]["name"] for line in lines}
+        assert names == {0: "Project one", 1: "Project two", 2: "Project one"}
+        # the trailing slash is the same page, resolved once
+        assert server.count("/one") == 1
+        assert server.count("/one/") == 0
+
+
+def test_batch_rejects_bad_body():
+    r = app.test_client().post("/products", json={"ids": "not a list"})
+    assert r.status_code == 400
+
+
+def test_big_batches_are_sent_to_jobs(monkeypatch):
+    monkeypatch.setattr(views, "MAX_STREAM_SIZE", 2)
+    r = app.test_client().post("/products", json=["a", "b", "c"])
+    assert r.status_code == 413
+    assert "/jobs" in r.get_json()["message"]
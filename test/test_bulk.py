@@ -0,0 +1,49 @@
+import json
+
+import bulk
+from test.stub_server import StubServer
+
+routes = {
+    "/first": (200, {}, "<html><title>First project</title></html>"),
+    "/second": (200, {}, "<html><title>Second project</title></html>"),
+}
+
+
+def test_killed_run_resumes_from_checkpoint(tmp_path):
+    with StubServer(routes) as server:
+        inputs = tmp_path / "inputs.txt"
+        inputs.write_text(
+            "{0}/first\n\n{0}/second\n".format(server.url), encoding="utf-8"
+        )
+        output = tmp_path / "results.jsonl"
+        # as if a previous run had finished the first line before being killed
+        output.write_text('{"index": 0}\n', encoding="utf-8")
+        (tmp_path / "results.jsonl.checkpoint").write_text("0\n", encoding="utf-8")
+
+        bulk.main([str(inputs), "-o", str(output), "--processes", "2"])
+
+        lines = [json.loads(line) for line in output.read_text().splitlines()]
+        assert [line["index"] for line in lines] == [0, 2]
+        assert lines[1]["result"]["name"] == "Second project"
+        assert server.count("/first") == 0
+        assert (tmp_path / "results.jsonl.checkpoint").read_text() == "0\n2\n"
+
+
+def test_resolve_many_yields_every_input():
+    with StubServer(routes) as server:
+        ids = [server.url + "/first", server.url + "/second"]
+        responses = list(bulk.resolve_many(ids, processes=2))
+    names = {r["index"]: r["result"]["name"] for r in responses}
+    assert names == {0: "First project", 1: "Second project"}
+
+
+def test_only_final_responses_are_checkpointed():
+    step = {"name": "WebpageMetadataStep", "partial": False}
+    complete = {"result": {"provenance": [step]}, "id": "https://example.org/x"}
+    assert bulk.is_final(complete)
+    partial = {"result": {"provenance": [dict(step, partial=True)]}, "id": "x"}
+    assert not bulk.is_final(partial)
+    failed = {"error_message": "couldn't resolve this input", "id": "x"}
+    assert not bulk.is_final(failed)
+    unsupported = {"error_message": "PDF documents are not supported.", "id": "x.pdf"}
+    assert bulk.is_final(unsupported)
@@ -0,0 +1,117 @@
+import json
+import time
+
+import bulk_doi
+from steps import http_cache
+from steps.deadline import Deadline
+from steps.fetch import http_get
+from test.stub_server import StubServer
+
+agencies = [
+    {"DOI": "10.1234/crossref", "RA": "Crossref"},
+    {"DOI": "10.5281/datacite", "RA": "DataCite"},
+    {"DOI": "10.9999/medra", "RA": "mEDRA"},
+]
+crossref_works = {
+    "message": {
+        "items": [
+            {
+                "DOI": "10.1234/crossref",
+                "type": "journal-article",
+                "title": ["A journal article"],
+                "container-title": ["Journal of Tests"],
+                "author": [{"family": "Lovelace", "given": "Ada"}],
+                "issued": {"date-parts": [[2019, 5]]},
+            }
+        ]
+    }
+}
+datacite_dois = {
+    "data": [
+        {
+            "id": "10.5281/datacite",
+            "attributes": {
+                "doi": "10.5281/datacite",
+                "titles": [{"title": "Some software"}],
+                "creators": [{"name": "Hopper, Grace", "familyName": "Hopper"}],
+                "publisher": "Zenodo",
+                "publicationYear": 2020,
+                "types": {"citeproc": "article"},
+            },
+        }
+    ]
+}
+routes = {
+    "/ra/10.1234/crossref,10.5281/datacite,10.9999/medra": (
+        200,
+        {},
+        json.dumps(agencies),
+    ),
+    "/works?filter=doi:10.1234/crossref&rows=1": (200, {}, json.dumps(crossref_works)),
+    "/dois?ids=10.5281/datacite&page%5Bsize%5D=1": (200, {}, json.dumps(datacite_dois)),
+    "/doi/10.9999/medra": (200, {}, '{"title": "Looked up on its own"}'),
+}
+
+
+def test_dois_are_resolved_in_bulk_by_agency(monkeypatch):
+    with StubServer(routes) as server:
+        monkeypatch.setattr(bulk_doi, "RA_URL", server.url + "/ra/")
+        monkeypatch.setattr(bulk_doi, "CROSSREF_API_URL", server.url)
+        monkeypatch.setattr(bulk_doi, "DATACITE_API_URL", server.url)
+        monkeypatch.setattr(bulk_doi, "DOI_URL", server.url + "/doi/")
+
+        results = bulk_doi.resolve_dois(
+            ["10.1234/crossref", "10.5281/datacite", "10.9999/medra"]
+        )
+        assert results["10.1234/crossref"]["type"] == "article-journal"
+        assert results["10.1234/crossref"]["title"] == "A journal article"
+        assert results["10.5281/datacite"]["author"] == [
+            {"family": "Hopper", "given": ""}
+        ]
+        assert results["10.5281/datacite"]["issued"] == {"date-parts": [[2020]]}
+        assert results["10.9999/medra"]["title"] == "Looked up on its own"
+
+        # bulk records are waiting in the cache for CrossrefResponseStep
+        r = http_get(server.url + "/doi/10.1234/crossref", headers=bulk_doi.CSL_HEADERS)
+        assert r.from_cache
+        assert r.json()["title"] == "A journal article"
+        assert server.count("/doi/10.1234/crossref") == 0
+        # but only for as long as the batch needs them
+        entry = http_cache.lookup(
+            server.url + "/doi/10.1234/crossref", bulk_doi.CSL_HEADERS
+        )
+        assert entry.expires_at <= time.time() + bulk_doi.SEED_TTL
+
+
+def test_doi_from_input():
+    assert bulk_doi.doi_from_input("https://doi.org/10.1234/ABC") == "10.1234/ABC"
+    assert bulk_doi.doi_from_input("https://github.com/x/y") is None
+
+
+def test_dois_are_quoted_in_bulk_queries():
+    assert (
+        bulk_doi.quote_dois(["10.1234/a;b", "10.1234/c#d"], prefix="doi:")
+        == "doi:10.1234/a%3Bb,doi:10.1234/c%23d"
+    )
+
+
+def test_prefetch_leaves_single_lookups_to_the_steps(monkeypatch):
+    ids = [
+        "https://doi.org/10.1234/crossref",
+        "https://doi.org/10.5281/datacite",
+        "https://doi.org/10.9999/medra",
+    ]
+    with StubServer(routes) as server:
+        monkeypatch.setattr(bulk_doi, "RA_URL", server.url + "/ra/")
+        monkeypatch.setattr(bulk_doi, "CROSSREF_API_URL", server.url)
+        monkeypatch.setattr(bulk_doi, "DATACITE_API_URL", server.url)
+        monkeypatch.setattr(bulk_doi, "DOI_URL", server.url + "/doi/")
+
+        expired = Deadline(0.001)
+        time.sleep(0.01)
+        bulk_doi.prefetch(ids, expired)
+        assert server.requests == []
+
+        bulk_doi.prefetch(ids, Deadline(5))
+        assert server.count("/works?filter=doi:10.1234/crossref&rows=1") == 1
+        assert server.count("/doi/10.9999/medra") == 0
@@ -0,0 +1,46 @@
+from canonical import canonical_id
+
+
+def test_equivalent_inputs_share_a_key():
+    assert (
+        canonical_id("10.5281/ZENODO.160400")
+        == canonical_id("doi:10.5281/zenodo.160400")
+        == canonical_id("https://doi.org/10.5281/zenodo.160400")
+        == canonical_id("http://dx.doi.org/10.5281/zenodo.160400")
+        == "doi:10.5281/zenodo.160400"
+    )
+    assert (
+        canonical_id("arXiv:1802.02689")
+        == canonical_id("1802.02689")
+        == canonical_id("https://arxiv.org/abs/1802.02689")
+        == "arxiv:1802.02689"
+    )
+    assert (
+        canonical_id("https://github.com/tidyverse/ggplot2")
+        == canonical_id(
+            "https://github.com/tidyverse/ggplot2/blob/master/man/borders.Rd"
+        )
+        == canonical_id("github.com/Tidyverse/ggplot2.git")
+        == "gh:tidyverse/ggplot2"
+    )
+    assert (
+        canonical_id("https://cran.r-project.org/web/packages/stringr")
+        == canonical_id(
+            "https://cran.r-project.org/web/packages/stringr/vignettes/stringr.html"
+        )
+        == canonical_id("https://CRAN.R-project.org/package=stringr")
+        == "cran:stringr"
+    )
+    assert (
+        canonical_id("https://pypi.python.org/pypi/Python_Executor")
+        == canonical_id("https://pypi.org/project/python-executor/")
+        == "pypi:python-executor"
+    )
+
+
+def test_other_kinds():
+    assert canonical_id("https://pubmed.ncbi.nlm.nih.gov/30371852/") == "pmid:30371852"
+    assert canonical_id("pmc6123456") == "pmcid:PMC6123456"
+    assert canonical_id("https://www.yt-project.org/") == "url:yt-project.org"
+    assert canonical_id("yt-project.org") == "url:yt-project.org"
+    assert canonical_id("  Some   Keywords ") == "kw:some keywords"
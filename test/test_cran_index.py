@@ -0,0 +1,123 @@
+import gzip
+import threading
+
+import pytest
+
+import cran_index
+from steps.cran import CranCitationFileStep, CranDescriptionFileStep
+from test.stub_server import StubServer
+
+STRINGR = """Package: stringr
+Title: Simple, Consistent Wrappers for Common String Operations
+Version: 1.5.0
+Authors@R:
+    c(person("Hadley", "Wickham", , "hadley@posit.co", role = c("aut", "cre", "cph")),
+      person("Posit Software, PBC", role = c("cph", "fnd")))
+URL: https://stringr.tidyverse.org, https://github.com/tidyverse/stringr
+Date/Publication: 2022-12-02 10:20:02 UTC"""
+
+TINY = """Package: tiny
+Title: A Tiny Package
+Version: 0.1
+Author: Ada Lovelace [aut, cre]
+Date/Publication: 2021-01-01 00:00:00 UTC"""
+
+
+STRINGR_CITATION = "<html><pre>@Manual{stringr, title = {stringr}}</pre></html>"
+
+
+def use_index(tmp_path, monkeypatch):
+    monkeypatch.setattr(cran_index, "INDEX_PATH", str(tmp_path / "cran.sqlite"))
+    monkeypatch.setattr(cran_index, "_local", threading.local())
+
+
+def test_bundles_and_unpacked_packages_are_indexed(tmp_path, monkeypatch):
+    use_index(tmp_path, monkeypatch)
+    assert cran_index.get("stringr") is None
+
+    bundle = tmp_path / "descriptions.dcf"
+    bundle.write_text(STRINGR + "\n\n" + TINY + "\n")
+    assert cran_index.import_paths([str(bundle)]) == 2
+    # unchanged versions aren't stored again
+    assert cran_index.import_paths([str(bundle)]) == 0
+    assert cran_index.get("stringr")["version"] == "1.5.0"
+    assert cran_index.get("stringr")["has_citation"] is None
+
+    package_dir = tmp_path / "unpacked" / "tiny"
+    package_dir.mkdir(parents=True)
+    (package_dir / "DESCRIPTION").write_text(TINY)
+    assert cran_index.import_paths([str(tmp_path / "unpacked")]) == 1
+    assert cran_index.get("Tiny")["has_citation"] is False
+
+    # no network: the steps read the index
+    step = CranDescriptionFileStep()
+    step.parent_content_url = "https://cran.r-project.org/web/packages/stringr"
+    step.set_content(None)
+    assert step.content.startswith("Package: stringr")
+    assert step.content_url.endswith("/stringr/DESCRIPTION")
+
+    citation_step = CranCitationFileStep()
+    citation_step.parent_content_url = "https://cran.r-project.org/web/packages/tiny"
+    citation_step.set_content(None)
+    assert citation_step.content is None
+
+
+def test_refresh_fetches_only_changed_packages(tmp_path, monkeypatch):
+    use_index(tmp_path, monkeypatch)
+    cran_index.put_many([(STRINGR, None, None), (TINY, None, None)])
+    routes = {
+        "/src/contrib/PACKAGES.gz": (
+            200,
+            {"Content-Type": "application/x-gzip"},
+            gzip.compress(
+                b"Package: stringr\nVersion: 1.5.1\n\nPackage: newpkg\nVersion: 1.0\n"
+            ),
+        ),
+        "/web/packages/stringr/DESCRIPTION": (
+            200,
+            {},
+            STRINGR.replace("1.5.0", "1.5.1"),
+        ),
+        "/web/packages/stringr/citation.html": (200, {}, STRINGR_CITATION),
+        # no citation.html: newpkg has no CITATION file
+        "/web/packages/newpkg/DESCRIPTION": (
+            200,
+            {},
+            "Package: newpkg\nTitle: New\nVersion: 1.0\n",
+        ),
+    }
+    with StubServer(routes) as server:
+        monkeypatch.setattr(cran_index, "CRAN_URL", server.url)
+        assert cran_index.refresh() == (2, 1)
+    assert cran_index.get("stringr")["version"] == "1.5.1"
+    assert cran_index.get("newpkg")["version"] == "1.0"
+    assert cran_index.get("newpkg")["has_citation"] is False
+    assert cran_index.get("tiny") is None
+
+    # no network: the citation step reads the index
+    citation_step = CranCitationFileStep()
+    citation_step.parent_content_url = "https://cran.r-project.org/web/packages/stringr"
+    citation_step.set_content(None)
+    assert citation_step.content == STRINGR_CITATION
+
+
+def test_refresh_never_drops_packages_on_a_broken_list(tmp_path, monkeypatch):
+    use_index(tmp_path, monkeypatch)
+    other = TINY.replace("tiny", "other")
+    cran_index.put_many(
+        [(STRINGR, None, None), (TINY, None, None), (other, None, None)]
+    )
+    routes = {"/src/contrib/PACKAGES.gz": (200, {}, gzip.compress(b""))}
+    with StubServer(routes) as server:
+        monkeypatch.setattr(cran_index, "CRAN_URL", server.url)
+        with pytest.raises(ValueError):
+            cran_index.refresh()
+
+        routes["/src/contrib/PACKAGES.gz"] = (
+            200,
+            {},
+            gzip.compress(b"Package: stringr\nVersion: 1.5.0\n"),
+        )
+        # tiny and other are missing, but so is most of the index
+        assert cran_index.refresh() == (0, 0)
+    assert cran_index.get("tiny")["version"] == "0.1"
@@ -0,0 +1,32 @@
+import time
+
+from software import Software
+from test.stub_server import StubServer
+
+
+def slow_page(handler):
+    time.sleep(2)
+    return 200, {}, "<title>too late</title>"
+
+
+def test_deadline_returns_partial_fallback():
+    with StubServer({"/slow": slow_page}) as server:
+        my_software = Software(server.url + "/slow", timeout_ms=500)
+        start = time.monotonic()
+        my_software.find_metadata()
+        assert time.monotonic() - start < 1.5
+
+        assert my_software.partial is True
+        provenance = my_software.get_provenance()
+        assert provenance[-1]["name"] == "WebpageMetadataStep"
+        assert provenance[-1]["partial"] is True
+        assert my_software.metadata["URL"] == server.url + "/slow"
+
+
+def test_fast_resolution_is_not_partial():
+    routes = {"/fast": (200, {}, "<html><title>A fast page</title></html>")}
+    with StubServer(routes) as server:
+        my_software = Software(server.url + "/fast", timeout_ms=5000)
+        my_software.find_metadata()
+        assert my_software.partial is False
+        assert my_software.name == "A fast page"
@@ -0,0 +1,70 @@
+import gzip
+import json
+import threading
+
+import doi_store
+from steps.crossref import CrossrefResponseStep
+
+crossref_file = {
+    "items": [
+        {
+            "DOI": "10.1234/ABC",
+            "type": "journal-article",
+            "title": ["A stored article"],
+            "author": [{"family": "Lovelace", "given": "Ada"}],
+        }
+    ]
+}
+datacite_record = {
+    "attributes": {
+        "doi": "10.5281/zenodo.1",
+        "titles": [{"title": "Stored software"}],
+        "creators": [{"name": "Hopper, Grace", "familyName": "Hopper"}],
+        "publicationYear": 2020,
+    }
+}
+
+
+def test_dumps_are_imported_incrementally(tmp_path, monkeypatch):
+    monkeypatch.setattr(doi_store, "STORE_PATH", str(tmp_path / "dois.sqlite"))
+    monkeypatch.setattr(doi_store, "_local", threading.local())
+    assert doi_store.get("10.1234/abc") is None
+
+    crossref_path = str(tmp_path / "crossref.json.gz")
+    with gzip.open(crossref_path, "wt") as f:
+        json.dump(crossref_file, f)
+    datacite_path = str(tmp_path / "datacite.jsonl")
+    with open(datacite_path, "w") as f:
+        f.write(json.dumps(datacite_record) + "\n")
+        f.write(json.dumps({"DOI": "10.9999/CSL", "title": "Already CSL"}) + "\n")
+
+    assert doi_store.import_files([crossref_path, datacite_path]) == 3
+    assert doi_store.import_files([crossref_path, datacite_path]) == 0
+    assert doi_store.store_stats() == {"dois": 3, "files": 2}
+
+    assert doi_store.get("10.1234/abc")["title"] == "A stored article"
+    assert doi_store.get("10.1234/ABC")["type"] == "article-journal"
+    assert doi_store.get("10.5281/zenodo.1")["author"] == [
+        {"family": "Hopper", "given": ""}
+    ]
+    assert doi_store.get("10.9999/csl")["title"] == "Already CSL"
+
+    # no network: the step finds the record before asking doi.org
+    step = CrossrefResponseStep()
+    step.set_content("10.1234/abc")
+    assert step.content["title"] == "A stored article"
+    assert step.content["URL"] == "https://doi.org/10.1234/abc"
+
+
+def test_untitled_crossref_works_are_converted():
+    work = {
+        "DOI": "10.1234/untitled",
+        "type": "proceedings-article",
+        "member": "311",
+        "deposited": {"date-parts": [[2020, 1, 1]]},
+        "container-title": ["Proceedings of Something"],
+    }
+    csl = doi_store.record_to_csl(work)
+    assert csl["type"] == "paper-conference"
+    assert csl["container-title"] == "Proceedings of Something"
+    assert "member" not in csl
@@ -0,0 +1,139 @@
+import time
+
+from steps import fetch
+from steps.deadline import Deadline
+from steps.fetch import http_get
+from steps.page_store import PageStore
+from steps.utils import get_hops, get_webpage_text
+from steps.webpage import WebpageStep
+from test.stub_server import StubServer
+
+
+def test_redirects_fetch_each_hop_once():
+    routes = {
+        "/start": (302, {"Location": "/refresh"}, ""),
+        "/refresh": (200, {}, '<meta http-equiv="refresh" content="0; url=/final">'),
+        "/final": (200, {}, "<title>final page</title>"),
+    }
+    with StubServer(routes) as server:
+        text = get_webpage_text(server.url + "/start")
+        assert text == "<title>final page</title>"
+        assert server.count("/start") == 1
+        assert server.count("/refresh") == 1
+        assert server.count("/final") == 1
+
+
+def test_meta_refresh_loop_stops_without_refetching():
+    routes = {
+        "/a": (200, {}, '<meta http-equiv="refresh" content="0; url=/b">'),
+        "/b": (200, {}, '<meta http-equiv="refresh" content="0; url=/a">'),
+    }
+    with StubServer(routes) as server:
+        hops = get_hops(server.url + "/a")
+        assert hops == [server.url + "/b", server.url + "/a"]
+        assert server.count("/a") == 1
+        assert server.count("/b") == 1
+
+
+def test_unreachable_page_returns_none():
+    assert get_webpage_text("http://127.0.0.1:1/nothing-here") is None
+
+
+def test_page_store_shares_pages_between_steps():
+    routes = {"/repo": (200, {}, "<title>repo</title>")}
+    with StubServer(routes) as server:
+        store = PageStore()
+        parent = WebpageStep()
+        parent.page_store = store
+        parent.set_content_url(server.url + "/repo")
+        parent.set_content(None)
+        sibling = WebpageStep()
+        sibling.page_store = store
+        sibling.set_content_url(server.url + "/repo")
+        sibling.set_content(None)
+
+        assert sibling.content == parent.content
+        assert server.count("/repo") == 1
+        assert sibling.to_dict()["page_store"] == {"hits": 1, "misses": 0}
+
+
+def test_whole_pages_read_with_until_are_shared():
+    routes = {"/repo": (200, {}, "<title>repo</title> no badge here")}
+    with StubServer(routes) as server:
+        store = PageStore()
+        page, hit = store.get_page(server.url + "/repo", until=r"zenodo\.\d+")
+        assert not page.truncated
+        page, hit = store.get_page(server.url + "/repo")
+        assert hit
+        assert server.count("/repo") == 1
+
+
+def test_body_is_capped_and_not_cached(monkeypatch):
+    monkeypatch.setattr(fetch, "MAX_BYTES", [(None, 1000)])
+    # as if the server hadn't sent a Content-Length
+    monkeypatch.setattr(fetch, "preflight", lambda r: None)
+    routes = {"/dump": (200, {"Content-Type": "text/html"}, "x" * 5000)}
+    with StubServer(routes) as server:
+        r = http_get(server.url + "/dump")
+        assert len(r.content) == 1000
+        assert r.truncated
+        http_get(server.url + "/dump")
+        assert server.count("/dump") == 2
+
+
+def test_binary_and_oversized_bodies_are_not_downloaded(monkeypatch):
+    monkeypatch.setattr(fetch, "MAX_BYTES", [(None, 1000)])
+    routes = {
+        "/paper": (200, {"Content-Type": "application/pdf"}, "%PDF-1.4"),
+        "/dump": (200, {"Content-Type": "text/html"}, "x" * 5000),
+    }
+    with StubServer(routes) as server:
+        pdf = http_get(server.url + "/paper")
+        assert pdf.skipped == "binary content (application/pdf)"
+        assert pdf.content == b""
+        dump = http_get(server.url + "/dump")
+        assert dump.skipped == "too large (5000 bytes)"
+
+
+def test_binary_webpage_goes_straight_to_metadata():
+    routes = {"/download": (200, {"Content-Type": "application/zip"}, "PK")}
+    with StubServer(routes) as server:
+        step = WebpageStep()
+        step.set_content_url(server.url + "/download")
+        step.set_content(server.url + "/download")
+        assert step.content == server.url + "/download"
+        assert step.remaining_children[-1].__name__ == "WebpageMetadataStep"
+        assert "PMIDStep" not in [c.__name__ for c in step.remaining_children]
+
+
+def test_until_stops_reading_at_first_match(monkeypatch):
+    monkeypatch.setattr(fetch, "CHUNK_SIZE", 100)
+    body = "a" * 300 + "10.5281/zenodo.12345 " + "b" * 5000
+    with StubServer({"/record": (200, {}, body)}) as server:
+        r = http_get(server.url + "/record", until=r"10\.5281/zenodo\.\d+\D")
+        assert r.truncated
+        assert "10.5281/zenodo.12345 " in r.text
+        assert len(r.content) < len(body)
+
+
+class TrickleResponse(object):
+    # a server sending a few bytes at a time, never idle long enough for a read timeout
+    url = "http://slow.example.com/page"
+    headers = {"Content-Type": "text/html"}
+    encoding = None
+
+    def iter_content(self, chunk_size):
+        for i in range(100):
+            time.sleep(0.05)
+            yield b"x" * 10
+
+    def close(self):
+        pass
+
+
+def test_reading_stops_at_the_deadline():
+    started = time.monotonic()
+    r = fetch.read_capped(TrickleResponse(), deadline=Deadline(0.3))
+    assert time.monotonic() - started < 1
+    assert r.truncated
+    assert 0 < len(r._content) < 1000
@@ -0,0 +1,94 @@
+import json
+
+from steps import github_snapshot
+from steps.github import GithubCitationFileStep, GithubRepoStep, GithubReadmeFileStep
+from steps.github_snapshot import parse_repo
+from steps.page_store import PageStore
+from test.stub_server import StubServer
+
+tree = {
+    "tree": [
+        {"path": "README.md", "type": "blob", "mode": "100644"},
+        {"path": "inst", "type": "tree", "mode": "040000"},
+        {"path": "inst/Citation", "type": "blob", "mode": "120000"},
+        {"path": "docs/CITATION.txt", "type": "blob", "mode": "100644"},
+        {"path": "docs/readme.md", "type": "blob", "mode": "100644"},
+    ]
+}
+routes = {
+    "/repos/x/y/git/trees/HEAD": (200, {}, json.dumps(tree)),
+    "/x/y/HEAD/README.md": (200, {}, "# y\nPlease cite us"),
+    "/x/y/HEAD/inst/Citation": (200, {}, "../docs/CITATION.txt"),
+    "/x/y/HEAD/docs/CITATION.txt": (200, {}, 'citEntry(title = "y")'),
+}
+
+
+def repo_step(monkeypatch, server):
+    monkeypatch.setattr(
+        github_snapshot, "TREE_URL", server.url + "/repos/{}/{}/git/trees/HEAD"
+    )
+    monkeypatch.setattr(github_snapshot, "RAW_URL", server.url + "/{}/{}/HEAD/{}")
+    step = GithubRepoStep()
+    step.content = "<html></html>"
+    step.content_url = "https://github.com/x/y"
+    step.page_store = PageStore()
+    return step
+
+
+def test_file_steps_share_one_snapshot(monkeypatch):
+    with StubServer(routes) as server:
+        parent = repo_step(monkeypatch, server)
+        citation = parent.make_child(GithubCitationFileStep)
+        parent.load_child(citation)
+        readme = parent.make_child(GithubReadmeFileStep)
+        parent.load_child(readme)
+
+        # inst/Citation is a symlink, matched case-insensitively
+        assert citation.content == 'citEntry(title = "y")'
+        assert citation.content_url == server.url + "/x/y/HEAD/inst/Citation"
+        assert readme.content.startswith("# y")
+        assert server.count("/repos/x/y/git/trees/HEAD") == 1
+        assert server.count("/x/y/HEAD/README.md") == 1
+
+
+def test_parse_repo():
+    assert parse_repo("https://github.com/x/y.git") == ("x", "y")
+    assert parse_repo("https://github.com/x") is None
+
+
+def test_truncated_tree_is_listed_level_by_level(monkeypatch):
+    truncated_routes = {
+        "/repos/x/z/git/trees/HEAD": (
+            200,
+            {},
+            json.dumps({"tree": [], "truncated": True}),
+        ),
+        "/repos/x/z/levels/HEAD": (
+            200,
+            {},
+            json.dumps({"tree": [{"path": "inst", "type": "tree", "sha": "abc"}]}),
+        ),
+        "/repos/x/z/levels/abc": (
+            200,
+            {},
+            json.dumps({"tree": [{"path": "CITATION", "type": "blob"}]}),
+        ),
+        "/x/z/HEAD/inst/CITATION": (200, {}, 'citEntry(title = "z")'),
+    }
+    with StubServer(truncated_routes) as server:
+        monkeypatch.setattr(
+            github_snapshot, "LEVEL_URL", server.url + "/repos/{}/{}/levels/{}"
+        )
+        parent = repo_step(monkeypatch, server)
+        parent.content_url = "https://github.com/x/z"
+        citation = parent.make_child(GithubCitationFileStep)
+        parent.load_child(citation)
+        assert citation.content == 'citEntry(title = "z")'
+
+
+def test_tree_listing_that_isnt_json_means_no_snapshot(monkeypatch):
+    with StubServer({"/repos/x/w/git/trees/HEAD": (200, {}, "<html>")}) as server:
+        monkeypatch.setattr(
+            github_snapshot, "TREE_URL", server.url + "/repos/{}/{}/git/trees/HEAD"
+        )
+        assert github_snapshot.GithubRepoSnapshot.load("x", "w") is None
@@ -0,0 +1,116 @@
+import base64
+import time
+
+import pytest
+
+from steps import github_tokens
+from steps.github import GithubApiResponseMetadataStep, GithubApiResponseStep
+from steps.github_tokens import GithubTokenPool, github_api_get
+from test.stub_server import StubServer
+
+
+def test_choose_prefers_most_remaining_quota():
+    pool = GithubTokenPool("a:token-a,b:token-b")
+    pool.update(pool.tokens[0], {"X-RateLimit-Remaining": "10"})
+    pool.update(pool.tokens[1], {"X-RateLimit-Remaining": "4000"})
+    assert pool.choose().login == "b"
+
+
+def test_exhausted_tokens_are_parked_until_reset():
+    pool = GithubTokenPool("a:token-a,b:token-b")
+    reset = str(int(time.time()) + 600)
+    pool.update(
+        pool.tokens[1], {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": reset}
+    )
+    pool.update(pool.tokens[0], {"X-RateLimit-Remaining": "1"})
+    assert pool.tokens[1].rate_limit().parked
+    assert pool.choose().login == "a"
+
+
+def test_parked_tokens_are_never_sent(monkeypatch):
+    pool = GithubTokenPool("a:token-a")
+    reset = str(int(time.time()) + 600)
+    pool.update(
+        pool.tokens[0], {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": reset}
+    )
+    monkeypatch.setattr(github_tokens, "_pool", pool)
+    with StubServer({}) as server:
+        with pytest.raises(github_tokens.GithubRateLimited):
+            github_api_get(server.url + "/repos/x/y")
+        assert server.requests == []
+
+
+def rate_limited_for_a(handler):
+    login = base64.b64decode(handler.headers["Authorization"].split()[1]).split(b":")[0]
+    if login == b"a":
+        return (
+            403,
+            {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": "9999999999"},
+            "",
+        )
+    return 200, {"X-RateLimit-Remaining": "4999"}, '{"ok": true}'
+
+
+def test_rate_limited_token_is_rotated_out(monkeypatch):
+    pool = GithubTokenPool("a:token-a,b:token-b")
+    monkeypatch.setattr(github_tokens, "_pool", pool)
+    with StubServer({"/repos/x/y": rate_limited_for_a}) as server:
+        r = github_api_get(server.url + "/repos/x/y")
+        assert r.json() == {"ok": True}
+        assert pool.tokens[0].rate_limit().parked
+        assert pool.tokens[1].rate_limit().remaining == 4999
+
+
+def test_graphql_content_matches_rest_shape(monkeypatch):
+    pool = GithubTokenPool("a:token-a")
+    monkeypatch.setattr(github_tokens, "_pool", pool)
+    body = (
+        '{"data": {"repository": {"name": "y", "url": "https://github.com/x/y",'
+        ' "createdAt": "2015-03-01T00:00:00Z",'
+        ' "owner": {"login": "x", "name": "Ada Lovelace"}}}}'
+    )
+    with StubServer(
+        {
+            "/graphql": (
+                200,
+                {"X-RateLimit-Remaining": "4990", "X-RateLimit-Resource": "graphql"},
+                body,
+            )
+        }
+    ) as server:
+        monkeypatch.setattr(github_tokens, "GRAPHQL_URL", server.url + "/graphql")
+        step = GithubApiResponseStep()
+        content = step.get_graphql_content("https://api.github.com/repos/x/y")
+        assert server.requests[0][2]["Authorization"] == "bearer token-a"
+    # GraphQL's quota is its own, REST keeps all of its quota
+    assert pool.tokens[0].rate_limit("graphql").remaining == 4990
+    assert pool.tokens[0].rate_limit().remaining == github_tokens.DEFAULT_LIMIT
+    assert content["user"]["login"] == "x"
+
+    metadata_step = GithubApiResponseMetadataStep()
+    metadata_step.set_content(content)
+    assert metadata_step.content["title"] == "y"
+    assert metadata_step.content["year"] == [["2015"]]
+    assert metadata_step.content["URL"] == "https://github.com/x/y"
+
+
+def test_graphql_needs_a_token(monkeypatch):
+    monkeypatch.setattr(github_tokens, "_pool", GithubTokenPool(""))
+    assert github_tokens.github_graphql("{ viewer { login } }", {}) is None
+
+
+def test_graphql_answers_are_cached_and_bad_json_is_a_miss(monkeypatch):
+    monkeypatch.setattr(github_tokens, "_pool", GithubTokenPool("a:token-a"))
+    routes = {
+        "/graphql": (200, {}, '{"data": {"viewer": {"login": "a"}}}'),
+        "/broken": (200, {"Content-Type": "text/html"}, "<html>unicorn</html>"),
+    }
+    with StubServer(routes) as server:
+        monkeypatch.setattr(github_tokens, "GRAPHQL_URL", server.url + "/graphql")
+        query = "{ viewer { login } }"
+        assert github_tokens.github_graphql(query, {}) == {"viewer": {"login": "a"}}
+        assert github_tokens.github_graphql(query, {}) == {"viewer": {"login": "a"}}
+        assert server.count("/graphql") == 1
+
+        monkeypatch.setattr(github_tokens, "GRAPHQL_URL", server.url + "/broken")
+        assert github_tokens.github_graphql(query, {}) is None
@@ -0,0 +1,104 @@
+import pytest
+import requests
+
+from steps import http_cache
+from steps.fetch import http_get
+from test.stub_server import StubServer
+
+routes = {
+    "/doc": (200, {"Content-Type": "text/html"}, "<title>cached</title>"),
+    "/missing": (404, {}, "nope"),
+}
+
+
+def test_second_get_is_served_from_cache():
+    with StubServer(routes) as server:
+        first = http_get(server.url + "/doc")
+        second = http_get(server.url + "/doc")
+        assert second.text == first.text == "<title>cached</title>"
+        assert getattr(second, "from_cache", False)
+        assert server.count("/doc") == 1
+
+
+def test_cache_survives_restart():
+    with StubServer(routes) as server:
+        http_get(server.url + "/doc")
+        http_cache.clear_l1()  # what a new worker process starts with
+        r = http_get(server.url + "/doc")
+        assert r.from_cache
+        assert server.count("/doc") == 1
+
+
+def test_accept_header_is_part_of_the_key():
+    with StubServer(routes) as server:
+        http_get(server.url + "/doc")
+        http_get(server.url + "/doc", headers={"Accept": "application/json"})
+        assert server.count("/doc") == 2
+
+
+def test_missing_pages_are_negatively_cached():
+    with StubServer(routes) as server:
+        first = http_get(server.url + "/missing")
+        hits_before = http_cache.stats["negative_hits"]
+        second = http_get(server.url + "/missing")
+        assert server.count("/missing") == 1
+        assert second.status_code == first.status_code == 404
+        assert second.text == first.text == "nope"
+        assert http_cache.stats["negative_hits"] == hits_before + 1
+
+
+def test_connection_failures_are_negatively_cached():
+    url = "http://127.0.0.1:1/refused"
+    with pytest.raises(requests.exceptions.ConnectionError):
+        http_get(url)
+    failure = http_cache.get_failure(url)
+    assert failure is not None and failure.status_class == "error"
+    with pytest.raises(requests.exceptions.ConnectionError):
+        http_get(url)
+
+
+def test_ttl_policies():
+    csl = "application/vnd.citationstyles.csl+json"
+    assert http_cache.ttl_for("https://doi.org/10.1/x", csl) == 21 * http_cache.DAY
+    assert (
+        http_cache.ttl_for("https://api.github.com/repos/a/b", "application/json") == 0
+    )
+    assert (
+        http_cache.ttl_for("https://github.com/a/b", "text/html") == 6 * http_cache.HOUR
+    )
+    assert http_cache.ttl_for("https://example.com", "text/html") == http_cache.DAY
+
+
+def etag_route(handler):
+    if handler.headers.get("If-None-Match") == '"v1"':
+        return 304, {"ETag": '"v1"'}, ""
+    return 200, {"ETag": '"v1"', "Content-Type": "application/json"}, '{"name": "repo"}'
+
+
+def test_stale_entries_are_revalidated_with_etag(monkeypatch):
+    monkeypatch.setattr(http_cache, "TTL_POLICIES", [("127.0.0.1", None, 0)])
+    with StubServer({"/api": etag_route}) as server:
+        first = http_get(server.url + "/api")
+        second = http_get(server.url + "/api")
+        assert second.json() == first.json() == {"name": "repo"}
+        assert second.status_code == 200
+        assert server.count("/api") == 2
+        conditional_request_headers = server.requests[-1][2]
+        assert conditional_request_headers["If-None-Match"] == '"v1"'
+
+
+def test_l1_is_bounded_by_body_bytes(monkeypatch):
+    monkeypatch.setattr(http_cache, "L1_MAX_BYTES", 2500)
+    monkeypatch.setattr(http_cache, "L1_MAX_BODY", 2000)
+    http_cache.clear_l1()
+    for name in ("a", "b", "c"):
+        http_cache.seed("http://example.org/" + name, None, b"x" * 1000, "text/html")
+    http_cache.seed("http://example.org/big", None, b"x" * 3000, "text/html")
+
+    assert list(http_cache._l1) == [
+        http_cache.cache_key("http://example.org/b"),
+        http_cache.cache_key("http://example.org/c"),
+    ]
+    assert http_cache.cache_stats()["l1_bytes"] == 2000
+    # too big for the process, but still shared through sqlite
+    assert http_cache.lookup("http://example.org/big").body == b"x" * 3000
@@ -0,0 +1,68 @@
+import time
+
+import jobs
+import product_cache
+from test.stub_server import StubServer
+from views import app
+
+routes = {"/slow-project": (200, {}, "<html><title>A queued project</title></html>")}
+
+
+def work_job(job_id):
+    # conftest turns the background workers off, so work the queue here
+    while jobs.work_once():
+        pass
+    return jobs.get_job(job_id)
+
+
+def test_expired_lease_is_claimed_again():
+    job_id = jobs.submit(["abandoned input"])
+    assert jobs.claim() == (job_id, 0, "abandoned input")
+    assert jobs.get_job(job_id)["status"] == "running"
+    assert jobs.claim() is None
+
+    # as if the worker holding it had died
+    jobs.get_db().execute(
+        "UPDATE job_items SET lease_until = ? WHERE job_id = ?",
+        (time.time() - 1, job_id),
+    )
+    assert jobs.claim() == (job_id, 0, "abandoned input")
+    jobs.finish(job_id, 0, {"error_message": "gave up"})
+    assert jobs.get_job(job_id)["status"] == "done"
+
+
+def test_job_is_resolved_by_a_worker():
+    with StubServer(routes) as server:
+        client = app.test_client()
+        r = client.post("/jobs", json={"id": server.url + "/slow-project"})
+        assert r.status_code == 202
+        job_id = r.get_json()["id"]
+        assert client.get(r.get_json()["status_url"]).get_json()["status"] == "queued"
+
+        job = work_job(job_id)
+    assert job["status"] == "done"
+    assert job["items"][0]["result"]["name"] == "A queued project"
+
+
+def test_failures_are_retried_then_given_up(monkeypatch):
+    calls = []
+
+    def failing_resolve(user_supplied_id, timeout_ms=None):
+        calls.append(user_supplied_id)
+        raise RuntimeError("upstream fell over")
+
+    monkeypatch.setattr(product_cache, "resolve", failing_resolve)
+    job_id = jobs.submit(["flaky input"])
+    job = work_job(job_id)
+    assert len(calls) == jobs.MAX_ATTEMPTS
+    assert job["status"] == "done"
+    assert job["counts"]["failed"] == 1
+    assert job["items"][0]["error_message"] == "couldn't resolve this input"
+
+
+def test_empty_job_is_rejected():
+    assert app.test_client().post("/jobs", json={"ids": []}).status_code == 400
+
+
+def test_unknown_job_is_404():
+    assert app.test_client().get("/jobs/nope").status_code == 404
@@ -0,0 +1,33 @@
+from software import Software
+from steps.deadline import Deadline
+from test.stub_server import StubServer
+
+routes = {
+    "/project": (
+        200,
+        {},
+        '<html><title>Prefetched project</title><a href="/docs">docs</a></html>',
+    )
+}
+
+
+def test_prefetch_picks_same_steps_as_sequential_walk():
+    with StubServer(routes) as server:
+        sequential = Software(server.url + "/project", prefetch=False)
+        sequential.find_metadata()
+        prefetched = Software(server.url + "/project", prefetch=True)
+        prefetched.find_metadata()
+
+        assert [s["name"] for s in prefetched.get_provenance()] == [
+            s["name"] for s in sequential.get_provenance()
+        ]
+        assert prefetched.name == sequential.name == "Prefetched project"
+        assert server.count("/project") == 1
+
+
+def test_cancelled_speculative_deadline_refuses_more_work():
+    deadline = Deadline(60)
+    speculative = deadline.derive()
+    speculative.cancel()
+    assert speculative.expired
+    assert not deadline.expired
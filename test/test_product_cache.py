@@ -0,0 +1,97 @@
+import time
+
+import product_cache
+from steps import user_input
+from test.stub_server import StubServer
+
+routes = {"/popular": (200, {}, "<html><title>A popular package</title></html>")}
+
+
+def test_fresh_result_is_served_without_resolving_again():
+    with StubServer(routes) as server:
+        first = product_cache.resolve(server.url + "/popular")
+        second = product_cache.resolve(server.url + "/popular")
+        assert second is first
+        assert first["name"] == "A popular package"
+        assert server.count("/popular") == 1
+
+
+def test_stale_result_is_served_while_refreshing(monkeypatch):
+    resolved = []
+
+    def fake_resolve_now(user_supplied_id, timeout_ms=None):
+        resolved.append(user_supplied_id)
+        product_cache.put(user_supplied_id, {"name": "new"})
+
+    monkeypatch.setattr(product_cache, "resolve_now", fake_resolve_now)
+    product_cache.put("stale-input", {"name": "old"})
+    key = product_cache.cache_key("stale-input")
+    product_cache._entries[key] = (
+        {"name": "old"},
+        time.time() - product_cache.TTL,
+        "stale-input",
+    )
+
+    assert product_cache.resolve("stale-input") == {"name": "old"}
+    for i in range(50):
+        if product_cache.get("stale-input") == {"name": "new"}:
+            break
+        time.sleep(0.01)
+    assert resolved == ["stale-input"]
+    assert product_cache.get("stale-input") == {"name": "new"}
+
+
+def test_least_recently_used_results_are_dropped(monkeypatch):
+    monkeypatch.setattr(product_cache, "SIZE", 2)
+    product_cache.put("a", {})
+    product_cache.put("b", {})
+    product_cache.get("a")
+    product_cache.put("c", {})
+    assert product_cache.get("b") is None
+    assert product_cache.get("a") == {}
+
+
+def test_inputs_sharing_a_key_keep_their_own_url():
+    repo_url = "https://github.com/x/shared"
+    blob_url = "https://github.com/x/shared/blob/master/README.md"
+    result = {
+        "url": repo_url,
+        "name": "shared",
+        "provenance": [
+            {"content_url": repo_url, "partial": False},
+            {"content_url": "https://api.github.com/repos/x/shared", "partial": False},
+        ],
+    }
+    product_cache.put(repo_url, result)
+
+    assert product_cache.get(repo_url) is result
+    for_blob = product_cache.get(blob_url)
+    assert for_blob["url"] == blob_url
+    assert for_blob["provenance"][0]["content_url"] == blob_url
+    assert for_blob["provenance"][1] == result["provenance"][1]
+    assert for_blob["name"] == "shared"
+
+
+def test_inputs_sharing_a_key_are_restamped_without_fetching(monkeypatch):
+    def no_network(*args, **kwargs):
+        raise AssertionError("fetched while re-stamping a cached result")
+
+    monkeypatch.setattr(user_input, "http_get", no_network)
+    result = {
+        "url": "http://example.org/tool",
+        "name": "tool",
+        "provenance": [
+            {"content_url": "http://example.org/tool", "key_word": None},
+            {"content_url": "http://example.org/tool", "partial": False},
+        ],
+    }
+    restamped = product_cache.for_input(
+        result, "http://example.org/tool", "example.org/tool"
+    )
+    assert restamped["url"] == "http://example.org/tool"
+
+    docs = dict(result, url="https://tool.readthedocs.io/en/stable/citation.html")
+    restamped = product_cache.for_input(
+        docs, "https://tool.readthedocs.io/", "https://tool.readthedocs.io/en/latest/"
+    )
+    assert restamped["url"] == docs["url"]
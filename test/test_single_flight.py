@@ -0,0 +1,99 @@
+import threading
+import time
+
+import single_flight
+
+
+def test_concurrent_callers_in_a_process_share_one_run():
+    calls = []
+
+    def slow():
+        calls.append(1)
+        time.sleep(0.3)
+        return {"name": "popular"}
+
+    results = []
+    threads = [
+        threading.Thread(
+            target=lambda: results.append(single_flight.run("gh:a/b", slow))
+        )
+        for i in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results == [{"name": "popular"}] * 5
+
+
+def test_result_published_by_another_worker_is_used():
+    # a thread has its own owner id, so it stands in for another worker process
+    def other_worker():
+        assert single_flight.lead("gh:c/d")
+        time.sleep(0.3)
+        single_flight.publish("gh:c/d", {"name": "from elsewhere"})
+
+    worker = threading.Thread(target=other_worker)
+    worker.start()
+    time.sleep(0.1)
+    result = single_flight.run("gh:c/d", lambda: {"name": "repeated"})
+    worker.join()
+    assert result == {"name": "from elsewhere"}
+
+
+def test_unshared_results_send_followers_off_on_their_own():
+    calls = []
+
+    def partial():
+        calls.append(1)
+        time.sleep(0.2)
+        return {"partial": True}
+
+    share = lambda result: not result["partial"]
+    threads = [
+        threading.Thread(target=single_flight.run, args=("gh:e/f", partial, share))
+        for i in range(3)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 3
+
+
+def test_followers_run_it_themselves_when_the_leader_fails():
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        time.sleep(0.2)
+        if len(calls) == 1:
+            raise ValueError("leader ran out of time")
+        return {"name": "retried"}
+
+    results = []
+
+    def follow():
+        results.append(single_flight.run("gh:g/h", flaky))
+
+    leader_errors = []
+
+    def lead():
+        try:
+            single_flight.run("gh:g/h", flaky)
+        except ValueError as e:
+            leader_errors.append(e)
+
+    leader = threading.Thread(target=lead)
+    leader.start()
+    time.sleep(0.05)
+    follower = threading.Thread(target=follow)
+    follower.start()
+    leader.join()
+    follower.join()
+
+    assert len(leader_errors) == 1
+    assert results == [{"name": "retried"}]
+    assert len(calls) == 2
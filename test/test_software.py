@@ -2,14 +2,9 @@
 # -*- coding: utf-8 -*-
 
 import pytest
-import requests_cache
 
 from software import Software
 
-requests_cache.install_cache(
-    "my_requests_cache", expire_after=60 * 60 * 24 * 7
-)  # expire_after is in seconds
-
 # run tests with pytest
 # Use harvard1 citation style
 
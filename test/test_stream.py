@@ -0,0 +1,58 @@
+import json
+import threading
+import time
+
+import product_cache
+import single_flight
+from test.stub_server import StubServer
+from views import app
+
+routes = {"/project": (200, {}, "<html><title>A streamed project</title></html>")}
+
+
+def parse_events(body):
+    events = []
+    for block in body.decode("utf-8").strip().split("\n\n"):
+        event, data = block.split("\n", 1)
+        events.append((event[len("event: ") :], json.loads(data[len("data: ") :])))
+    return events
+
+
+def test_steps_stream_before_the_result():
+    with StubServer(routes) as server:
+        r = app.test_client().get("/stream/product/" + server.url + "/project")
+        assert r.mimetype == "text/event-stream"
+        events = parse_events(r.data)
+
+    kinds = [kind for kind, data in events]
+    assert kinds[0] == "step"
+    assert kinds[-1] == "result"
+    assert kinds.count("result") == 1
+    step_names = [data["name"] for kind, data in events if kind == "step"]
+    assert step_names[0] == "UserInputStep"
+    assert step_names[-1] == "WebpageMetadataStep"
+    result = events[-1][1]
+    assert result["name"] == "A streamed project"
+    assert [s["name"] for s in result["provenance"]] == step_names
+
+
+def test_stream_joins_a_resolution_already_under_way():
+    url = "http://example.org/trending"
+    key = product_cache.cache_key(url)
+    step = {"name": "UserInputStep", "content_url": url, "partial": False}
+    result = {"url": url, "name": "Trending", "provenance": [step]}
+
+    # a thread has its own owner id, so it stands in for another worker process
+    def other_worker():
+        assert single_flight.lead(key)
+        time.sleep(0.3)
+        single_flight.publish(key, [url, result])
+
+    worker = threading.Thread(target=other_worker)
+    worker.start()
+    time.sleep(0.1)
+    r = app.test_client().get("/stream/product/" + url)
+    events = parse_events(r.data)
+    worker.join()
+
+    assert events == [("step", step), ("result", result)]
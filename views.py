@@ -2,11 +2,18 @@ import json
 import os
 import sys
 
-from flask import abort, jsonify, make_response, render_template, request
+from flask import Response, abort, jsonify, make_response, render_template, request
+from werkzeug.exceptions import HTTPException
 
 from app import app
-from software import Software
+from batch import MAX_BATCH_SIZE, MAX_STREAM_SIZE, resolve_batch
+import jobs
+import product_cache
+import single_flight
+from software import Software, unsupported_input_message
 from steps.core import step_configs
+from steps.github_tokens import get_token_pool
+from steps.http_cache import cache_stats
 
 
 def json_dumper(obj):
@@ -33,6 +40,11 @@ def json_resp(thing):
     return resp
 
 
+def sse_event(event, data):
+    data_str = json.dumps(data, sort_keys=True, default=json_dumper)
+    return "event: {}\ndata: {}\n\n".format(event, data_str)
+
+
 def abort_json(status_code, msg):
     body_dict = {"HTTP_status_code": status_code, "message": msg, "error": True}
     resp_string = json.dumps(body_dict, sort_keys=True, indent=4)
@@ -74,14 +86,124 @@ def index_endpoint():
 
 @app.route("/product/<path:id>", methods=["GET"])
 def citeas_product_get(id):
-    if id.endswith(".pdf"):
-        return jsonify({"error_message": "PDF documents are not supported."})
-    elif id.endswith((".doc", "docx")):
-        return jsonify({"error_message": "Word documents are not supported."})
+    error_message = unsupported_input_message(id)
+    if error_message:
+        return jsonify({"error_message": error_message})
+    else:
+        timeout_ms = request.args.get("timeout_ms", type=int)
+        return jsonify(product_cache.resolve(id, timeout_ms=timeout_ms))
+
+
+@app.route("/stream/product/<path:id>", methods=["GET"])
+def citeas_product_stream(id):
+    """
+    Same resolution as /product, as server-sent events: a "step" event for each
+    provenance step as it completes, then a "result" event with the full response.
+    """
+    error_message = unsupported_input_message(id)
+    timeout_ms = request.args.get("timeout_ms", type=int)
+
+    def events():
+        if error_message:
+            yield sse_event("error", {"error_message": error_message})
+            return
+
+        result = product_cache.get(id)
+        try:
+            if result is None and single_flight.is_running(product_cache.cache_key(id)):
+                # join the resolution already under way rather than walking again
+                result = product_cache.resolve_now(id, timeout_ms)
+        except HTTPException as e:
+            yield sse_event("error", {"error_message": e.description})
+            return
+        if result is not None:
+            for step_dict in result["provenance"]:
+                yield sse_event("step", step_dict)
+            yield sse_event("result", result)
+            return
+
+        my_software = Software(id, timeout_ms=timeout_ms)
+        try:
+            # a client that disconnects closes this generator, which ends the walk
+            for step in my_software.iter_steps():
+                yield sse_event("step", step.to_dict())
+        except HTTPException as e:
+            # steps signal bad input with abort()
+            yield sse_event("error", {"error_message": e.description})
+            return
+        result = my_software.to_dict()
+        if not my_software.partial:
+            product_cache.put(id, result)
+        yield sse_event("result", result)
+
+    # no buffering in nginx or the heroku router
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return Response(events(), mimetype="text/event-stream", headers=headers)
+
+
+def get_posted_ids(max_size, too_many_message):
+    # a JSON list of identifiers, {"ids": [...]} or {"id": "..."}
+    body = request.get_json(silent=True)
+    if isinstance(body, dict):
+        ids = [body["id"]] if "id" in body else body.get("ids")
     else:
-        my_software = Software(id)
-        my_software.find_metadata()
-        return jsonify(my_software.to_dict())
+        ids = body
+    if not isinstance(ids, list) or not all(isinstance(id, str) for id in ids):
+        abort_json(400, 'Send a JSON list of identifiers, or {"ids": [...]}.')
+    if not ids:
+        abort_json(400, "Send at least one identifier.")
+    if len(ids) > max_size:
+        abort_json(413, too_many_message.format(max_size))
+    return ids
+
+
+@app.route("/products", methods=["POST"])
+def citeas_products_post():
+    ids = get_posted_ids(
+        MAX_STREAM_SIZE,
+        "At most {} identifiers per request. Send bigger batches to POST /jobs, "
+        "or resolve them offline with bulk.py.",
+    )
+    timeout_ms = request.args.get("timeout_ms", type=int)
+
+    # one json object per line, sent as each input is resolved
+    def ndjson_lines():
+        for line in resolve_batch(ids, timeout_ms=timeout_ms):
+            yield json.dumps(line, sort_keys=True, default=json_dumper) + "\n"
+
+    return Response(ndjson_lines(), mimetype="application/x-ndjson")
+
+
+@app.route("/jobs", methods=["POST"])
+def citeas_jobs_post():
+    ids = get_posted_ids(
+        MAX_BATCH_SIZE,
+        "At most {} identifiers per job. Resolve bigger batches with bulk.py.",
+    )
+    job_id = jobs.submit(ids)
+    resp = jsonify({"id": job_id, "status_url": "/jobs/{}".format(job_id)})
+    resp.status_code = 202
+    return resp
+
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def citeas_jobs_get(job_id):
+    job = jobs.get_job(job_id)
+    if job is None:
+        abort_json(404, "No job with that id.")
+    return jsonify(job)
+
+
+@app.route("/stats", methods=["GET"])
+def citeas_stats():
+    return jsonify(
+        {
+            "http_cache": cache_stats(),
+            "product_cache": product_cache.cache_stats(),
+            "single_flight": single_flight.flight_stats(),
+            "github_tokens": get_token_pool().to_dict(),
+        }
+    )
 
 
 @app.route("/steps", methods=["GET"])
@@ -90,6 +212,11 @@ def citeas_step_configs():
     return jsonify(step_configs())
 
 
+# every web process works the job queue from the start, so jobs queued before a
+# restart don't wait for someone to poll them
+jobs.start_workers()
+
+
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 5000))
     app.run(host="0.0.0.0", port=port, threaded=True)